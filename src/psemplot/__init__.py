@@ -1,5 +1,5 @@
-__names__ = ['colors','plot_data','helpers','parse_args','projection','grid_plot','scatter_plot']
-__all__ = ['colors','plot_data','helpers','parse_args','projection','grid_plot','scatter_plot']
+__names__ = ['colors','plot_data','helpers','parse_args','projection','grid_plot','scatter_plot','species','formula','tiles','sketch','shared','debug','raster','shapes']
+__all__ = ['colors','plot_data','helpers','parse_args','projection','grid_plot','scatter_plot','species','formula','tiles','sketch','shared','debug','raster','shapes']
 
 import psemplot.inputs
 import psemplot.api
@@ -3,6 +3,9 @@ module loader for custom input types
 
 A custom input type can be created as long as it maps
 
+The var method of an input type must accept the signature var(var_name, tstep=None, layer=None, rows=None)
+ and return a 4D array (TSTEP, LAY, ROW, COL) with the integer-selected dimensions dropped.
+ rows is a slice of the ROW dimension. Only the selected hyperslab should be read from the file.
 """
 
 
@@ -10,6 +13,23 @@ import os.path
 import importlib as il
 
 
+def select_slab(tstep=None, layer=None, rows=None):
+    '''
+    Build the index for a timestep, layer, and row selection of a 4D (TSTEP, LAY, ROW, COL) variable
+    A selection of None keeps the whole dimension
+    '''
+    if rows is None:
+        return tuple(slice(None) if x is None else x for x in (tstep, layer)) + (Ellipsis,)
+    return tuple(slice(None) if x is None else x for x in (tstep, layer, rows)) + (Ellipsis,)
+
+def configure_input(module_name, **kwargs):
+    '''
+    Pass options to an input module that defines a configure function
+    '''
+    mod = il.import_module('.%s' %module_name, 'psemplot.inputs')
+    if hasattr(mod, 'configure'):
+        mod.configure(**kwargs)
+
 def load_input(module_name, infile_name):
     '''
     Validate an input module and load the file
@@ -0,0 +1,102 @@
+"""
+Treat a list of input files as a single logical input
+
+Species grids are reduced across the files with a running accumulator. The files
+ are read by a bounded pool of worker threads so that only a few grids are held in
+ memory at a time.
+"""
+
+import glob
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .inputs import load_input
+from ..species import Reducer, read_grid
+
+def expand_input(in_spec):
+    '''
+    Expand an input specification into a list of files
+    A specification starting with @ is a text file listing one input file per line
+    A specification containing wildcards is expanded as a sorted glob
+    '''
+    if in_spec.startswith('@'):
+        with open(in_spec[1:]) as f:
+            file_list = [l.strip() for l in f if l.strip() and not l.startswith('#')]
+    elif any(c in in_spec for c in '*?['):
+        file_list = sorted(glob.glob(in_spec))
+    else:
+        return [in_spec]
+    if not file_list:
+        raise ValueError('No input files found for %s' %in_spec)
+    return file_list
+
+class MultiData(object):
+    """
+    Instance of a list of input files reduced into one input
+    """
+    def __init__(self, module_name, file_list, method='sum', workers=2):
+        self.module_name = module_name
+        self.file_list = file_list
+        self.method = method
+        self.workers = max(int(workers), 1)
+        self.filename = '%s (%d files)' %(file_list[0], len(file_list))
+        # Take the grid definition from the first file in the list
+        ref = load_input(module_name, file_list[0])
+        for att, val in list(vars(ref).items()):
+            if att not in ('src','filename'):
+                setattr(self, att, val)
+        ref.close()
+
+    def __str__(self):
+        return self.filename
+
+    def check_grid(self, in_file):
+        '''
+        Check a member file for a dimensional mismatch with the logical input
+        '''
+        if in_file.cols != self.cols or in_file.rows != self.rows or in_file.xcell != self.xcell or \
+            in_file.xorig != self.xorig or in_file.yorig != self.yorig:
+                raise ValueError('Dimensional mismatch between %s and %s' %(self.file_list[0], in_file))
+
+    def read_member(self, infile_name, read_fn):
+        '''
+        Open a member file, read from it, and close it
+        '''
+        in_file = load_input(self.module_name, infile_name)
+        try:
+            self.check_grid(in_file)
+            return read_fn(in_file)
+        finally:
+            in_file.close()
+
+    def reduce(self, read_fn, label, report=True, dtype=None):
+        '''
+        Reduce the values returned by read_fn across all of the files
+        No more than one pending read per worker is queued ahead of the accumulator
+        '''
+        red = Reducer(self.method, dtype)
+        start = time.time()
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for infile_name in self.file_list:
+                pending.append(pool.submit(self.read_member, infile_name, read_fn))
+                if len(pending) >= self.workers:
+                    red.add(pending.popleft().result())
+            while pending:
+                red.add(pending.popleft().result())
+        if report:
+            red.report('%s across %s' %(label, self), time.time() - start)
+        return red.result()
+
+    def var(self, var_name, tstep=None, layer=None, rows=None):
+        return self.reduce(lambda in_file: in_file.var(var_name, tstep, layer, rows), var_name)
+
+    def read_grid(self, var_name, tsteps, layer=0, method='sum', rows=None, report=True, dtype=None):
+        '''
+        Reduce each file over the timesteps and then reduce across the files
+        '''
+        return self.reduce(lambda in_file: read_grid(in_file, var_name, tsteps, layer, method, False, rows, dtype),
+          var_name, report, dtype)
+
+    def close(self):
+        pass
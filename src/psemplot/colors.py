@@ -5,6 +5,8 @@ Determine the colors and mappings for the data and legend
 import pylab as p
 import matplotlib.colors as mpcol 
 import numpy as np
+import numpy.ma as ma
+from .sketch import QuantileSketch
 
 # Compatability with 1.5 matplotlib colormaps
 # Viridis_r is popular
@@ -31,15 +33,143 @@ ldhb_colors = ['magenta','magenta','darkblue','blue','cyan','lightgray','lightgr
 ldhb_cmap = mpcol.LinearSegmentedColormap.from_list('ldhb', ldhb_colors)
 p.register_cmap(cmap=ldhb_cmap)
 
+class DataStats(object):
+    """
+    Summary statistics of a plot dataset that can be collected block by block
+    The raw min and max are of all values. The data min and max exclude values below mask_less.
+    Masked cells, such as missing values in the input files, are not counted.
+    Percentiles are calculated from the whole dataset on request and cached.
+    With approx the percentiles are instead estimated from a quantile sketch that is fed block by block.
+    """
+    # Data with fewer nonzero values than this fraction is treated as sparse
+    sparse_fraction = 0.5
+
+    def __init__(self, data=None, mask_less=None, approx=False):
+        self.mask_less = mask_less
+        self.sketch = QuantileSketch() if approx else None
+        self.data = None
+        self.raw_min = None
+        self.raw_max = None
+        self.data_min = None
+        self.data_max = None
+        self.has_neg = False
+        self.has_pos = False
+        self.pers = {}
+        if data is not None:
+            self.update(data)
+            self.data = data
+
+    def update(self, block):
+        '''
+        Fold a block of the dataset into the running statistics
+        '''
+        if isinstance(block, ma.MaskedArray):
+            block = block.compressed()
+            if not block.size:
+                return
+        if self.sketch is not None:
+            self.sketch.add(block)
+        self.raw_min = block.min() if self.raw_min is None else min(self.raw_min, block.min())
+        self.raw_max = block.max() if self.raw_max is None else max(self.raw_max, block.max())
+        if self.mask_less:
+            block = block[block >= float(self.mask_less)]
+            if not block.size:
+                return
+        self.data_min = block.min() if self.data_min is None else min(self.data_min, block.min())
+        self.data_max = block.max() if self.data_max is None else max(self.data_max, block.max())
+        self.has_neg = bool(self.data_min < 0)
+        self.has_pos = bool(self.data_max > 0)
+
+    def merge(self, other):
+        '''
+        Fold the statistics of another part of the dataset, such as a block collected by another worker
+        '''
+        for att, pick in (('raw_min', min), ('raw_max', max), ('data_min', min), ('data_max', max)):
+            val = getattr(other, att)
+            if val is not None:
+                setattr(self, att, val if getattr(self, att) is None else pick(getattr(self, att), val))
+        self.has_neg = self.has_neg or other.has_neg
+        self.has_pos = self.has_pos or other.has_pos
+        if self.sketch is not None:
+            if other.sketch is None:
+                raise ValueError('Statistics without a quantile sketch cannot be merged into a sketch')
+            self.sketch.merge(other.sketch)
+        self.pers = {}
+
+    def request(self, pers):
+        '''
+        Calculate a list of percentiles of the data with a single partition and cache them
+        Percentiles are of the values of the cells that are not masked
+        Values are interpolated linearly between the closest ranks, the same as np.percentile
+        Sparse data is ranked from its nonzero values and a count of the zeros
+        '''
+        pers = [float(per) for per in pers if float(per) not in self.pers]
+        if not pers:
+            return
+        if self.sketch is not None:
+            for per in pers:
+                self.pers[per] = self.sketch.quantile(per / 100.)
+            return
+        if self.data is None:
+            raise ValueError('No data available to calculate percentiles')
+        if min(pers) < 0 or max(pers) > 100:
+            raise ValueError('Percentiles must be in the range 0-100')
+        if isinstance(self.data, ma.MaskedArray):
+            values = self.data.compressed()
+        else:
+            values = np.asarray(self.data).ravel()
+        size = values.size
+        # For sparse data only the nonzero values are partitioned. The zeros are counted and
+        #  fill the ranks between the negative and positive values.
+        zeros = 0
+        if np.count_nonzero(values) < size * self.sparse_fraction:
+            values = values[values != 0]
+            zeros = size - values.size
+        nneg = np.count_nonzero(values < 0) if zeros else 0
+        def index(rank):
+            if rank < nneg:
+                return rank
+            if rank < nneg + zeros:
+                return None
+            return rank - zeros
+        ranks = [per / 100. * (size - 1) for per in pers]
+        kth = set([index(int(np.floor(rank))) for rank in ranks] + [index(int(np.ceil(rank))) for rank in ranks])
+        kth.discard(None)
+        if kth:
+            values = np.partition(values, sorted(kth))
+        def value(rank):
+            idx = index(rank)
+            return values.dtype.type(0) if idx is None else values[idx]
+        for per, rank in zip(pers, ranks):
+            low = value(int(np.floor(rank)))
+            high = value(int(np.ceil(rank)))
+            frac = rank - np.floor(rank)
+            if frac < 0.5:
+                self.pers[per] = low + (high - low) * frac
+            else:
+                self.pers[per] = high - (high - low) * (1 - frac)
+
+    def percentile(self, per):
+        '''
+        Return a percentile of the data, calculating it if it has not been requested
+        '''
+        if float(per) not in self.pers:
+            self.request([per,])
+        return self.pers[float(per)]
+
 class VLimit(object):
     """
     Calculate data plot limits
     """
-    def __init__(self, x, data):
+    def __init__(self, x, data, stats=None):
         self.per = ''
-        self.get_lim(x, data)
-        self.data_min = data.min()
-        self.data_max = data.max()
+        self.get_lim(x, data, stats)
+        if stats is not None:
+            self.data_min = stats.data_min
+            self.data_max = stats.data_max
+        else:
+            self.data_min = data.min()
+            self.data_max = data.max()
 
     def __call__(self):
         return self.x
@@ -47,7 +177,7 @@ class VLimit(object):
     def __str__(self):
         return str(self.x)
 
-    def get_lim(self, x, data):
+    def get_lim(self, x, data, stats=None):
         """
         Return a numerical value based on a numerical limit
         or on a percentile 
@@ -57,7 +187,10 @@ class VLimit(object):
             # Calculate the percentile value
             self.nper = float(x.split('%')[0])
             if self.nper > 0:
-                x = np.percentile(data, self.nper)
+                if stats is not None:
+                    x = stats.percentile(self.nper)
+                else:
+                    x = np.percentile(np.asarray(data), self.nper)
             else:
                 x = 0
         try:
@@ -0,0 +1,68 @@
+"""
+Debug counters for the grid-sized memory allocated by each stage of a plot
+"""
+
+import tracemalloc
+from contextlib import contextmanager
+
+class AllocCounter(object):
+    """
+    Measure the allocations of plot stages with tracemalloc in units of the plotted grid size
+    The peak is the most memory held at once by the allocations of a stage and the held count
+      is what is still allocated when the stage ends. Stages must not be nested.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.grid_bytes = 0
+
+    def enable(self, grid_bytes):
+        '''
+        Start tracing allocations, counting them in grids of the given size
+        '''
+        self.enabled = True
+        self.grid_bytes = grid_bytes
+        tracemalloc.start()
+
+    def start(self):
+        '''
+        Forget the allocations of earlier stages
+        '''
+        if self.enabled:
+            tracemalloc.clear_traces()
+
+    def report(self, name):
+        '''
+        Print the grid-sized allocations made since the stage started
+        '''
+        if self.enabled:
+            held, peak = tracemalloc.get_traced_memory()
+            grid_bytes = float(max(self.grid_bytes, 1))
+            print('NOTE: Allocations in %s: %.1f grids at peak, %.1f grids held' %(name, peak / grid_bytes,
+              held / grid_bytes))
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Count the allocations made while the block is run
+        '''
+        self.start()
+        try:
+            yield
+        finally:
+            self.report(name)
+
+    def iterate(self, name, items):
+        '''
+        Yield the items of an iterator, counting the allocations made to generate each one
+        '''
+        items = iter(items)
+        while True:
+            self.start()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.report(name)
+            yield item
+
+alloc_counter = AllocCounter()
@@ -0,0 +1,210 @@
+"""
+Compile and evaluate the plot formula
+
+The formula is parsed into a syntax tree once and checked against the allowed operations.
+ Evaluation applies each operation in place on a small pool of reused grid buffers, so a
+ long formula does not allocate a new grid for every operator.
+"""
+
+import ast
+import sys
+import numpy as np
+import numpy.ma as ma
+from .helpers import parse_form
+
+bin_ops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide,
+  ast.Mod: np.mod, ast.Pow: np.power}
+unary_ops = {ast.USub: np.negative, ast.UAdd: np.positive}
+
+def literal(node):
+    '''
+    Return the value of a number or string literal node, or None if the node is not a literal
+    Python 3.7 and older parse literals as Num and Str nodes rather than Constant nodes
+    '''
+    if sys.version_info < (3, 8):
+        if isinstance(node, ast.Num):
+            return node.n
+        elif isinstance(node, ast.Str):
+            return node.s
+    elif isinstance(node, ast.Constant):
+        return node.value
+    return None
+
+def copy_grid(grid):
+    '''
+    Copy a grid in native byte order, keeping the mask of a masked grid
+    '''
+    dtype = grid.dtype.newbyteorder('=')
+    if isinstance(grid, ma.MaskedArray):
+        return ma.array(grid, dtype=dtype, copy=True)
+    return np.array(grid, dtype=dtype)
+
+class Formula(object):
+    """
+    Compiled plot formula
+    """
+    def __init__(self, form):
+        self.form = form
+        # Get the Python-ready formula and pollutant list
+        self.py_form, self.pol_list = parse_form(form)
+        try:
+            tree = ast.parse(self.py_form.strip(), mode='eval')
+        except SyntaxError:
+            raise ValueError('Unable to parse formula: %s' %form)
+        self.tree = self.compile_node(tree.body)
+
+    def __str__(self):
+        return self.py_form
+
+    def compile_node(self, node):
+        '''
+        Convert a syntax tree node into an operation tuple, allowing only arithmetic on species and numbers
+        '''
+        if isinstance(node, ast.BinOp) and type(node.op) in bin_ops:
+            return ('binary', bin_ops[type(node.op)], self.compile_node(node.left), self.compile_node(node.right))
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in unary_ops:
+            return ('unary', unary_ops[type(node.op)], self.compile_node(node.operand))
+        elif isinstance(literal(node), (int, float)) and not isinstance(literal(node), bool):
+            return ('const', literal(node))
+        elif isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'species':
+            key = node.slice.value if isinstance(node.slice, getattr(ast, 'Index', ())) else node.slice
+            if isinstance(literal(key), str) and literal(key) in self.pol_list:
+                return ('species', literal(key))
+        raise ValueError('Invalid expression "%s" in formula %s' %(self.source(node), self.form))
+
+    def source(self, node):
+        '''
+        Text of a formula expression for error messages
+        '''
+        try:
+            return ast.get_source_segment(self.py_form.strip(), node) or type(node).__name__
+        except AttributeError:
+            return type(node).__name__
+
+    def evaluate(self, species):
+        '''
+        Calculate the plottable 2D dataset from the species grids
+        The returned grid is always a new array that is safe to modify
+        '''
+        return next(FormulaBatch([self]).evaluate(dict(species)))
+
+class FormulaBatch(object):
+    """
+    Dependency graph of one or more compiled formulas
+    Each species and each common subexpression is a single node, so it is read or calculated
+     once. Intermediate grids are released as soon as their last consumer has been evaluated.
+    """
+    def __init__(self, formulas, dtype=None):
+        self.formulas = formulas
+        # Numeric constants are applied in the compute precision so they do not promote the grids
+        self.dtype = dtype
+        self.nodes = []
+        self.node_ids = {}
+        self.refs = []
+        self.pol_list = []
+        for formula in formulas:
+            [self.pol_list.append(pol) for pol in formula.pol_list if pol not in self.pol_list]
+        self.roots = [self.add_node(formula.tree) for formula in formulas]
+        for root in self.roots:
+            self.refs[root] += 1
+        self.free = []
+
+    def add_node(self, tree):
+        '''
+        Add an operation tuple to the graph and return its node id
+        Identical subexpressions map to the same node. Sums and products are matched in either order.
+        '''
+        kind = tree[0]
+        if kind in ('species','const'):
+            key = (kind, tree[1], type(tree[1]))
+            children = ()
+        else:
+            children = tuple(self.add_node(child) for child in tree[2:])
+            if tree[1] in (np.add, np.multiply):
+                key = (kind, tree[1], tuple(sorted(children)))
+            else:
+                key = (kind, tree[1], children)
+        if key not in self.node_ids:
+            self.node_ids[key] = len(self.nodes)
+            self.nodes.append((kind, tree[1], children))
+            self.refs.append(0)
+            for child in children:
+                self.refs[child] += 1
+        return self.node_ids[key]
+
+    def evaluate(self, species):
+        '''
+        Generate the result grid of each formula in order
+        The species grids are removed from the species dictionary once they are no longer needed
+        Each returned grid is a new array that is safe to modify
+        '''
+        self.values = {}
+        self.free = []
+        refs = list(self.refs)
+        for root in self.roots:
+            result, owned = self.eval_node(root, species, refs)
+            refs[root] -= 1
+            if refs[root]:
+                # The result is still needed for a later formula
+                result = copy_grid(result)
+            else:
+                del self.values[root]
+                if not owned:
+                    result = copy_grid(result)
+            yield result
+        self.free = []
+
+    def buffer(self, like, dtype):
+        '''
+        Get a scratch grid from the pool of released buffers or allocate a new one
+        '''
+        for n, buf in enumerate(self.free):
+            if buf.shape == like.shape and buf.dtype == dtype:
+                return self.free.pop(n)
+        return np.empty(like.shape, dtype=dtype)
+
+    def release(self, node_id, refs, keep=None):
+        '''
+        Drop a reference to a node value and free it after the last reference
+        '''
+        refs[node_id] -= 1
+        if not refs[node_id]:
+            val, owned = self.values.pop(node_id)
+            if owned and val is not keep and not isinstance(val, ma.MaskedArray):
+                self.free.append(val)
+
+    def eval_node(self, node_id, species, refs):
+        '''
+        Evaluate a node. Returns the value and whether it is a scratch buffer that may be overwritten
+          once this node has no other consumers
+        '''
+        if node_id in self.values:
+            return self.values[node_id]
+        kind, func, children = self.nodes[node_id]
+        if kind == 'species':
+            val, owned = species.pop(func), False
+        elif kind == 'const':
+            val, owned = (self.dtype.type(func) if self.dtype else func), False
+        else:
+            args = [self.eval_node(child, species, refs) for child in children]
+            vals = [arg[0] for arg in args]
+            grids = [x for x in vals if not np.isscalar(x)]
+            # Masked grids are calculated with the masked array operators
+            if not grids or any(isinstance(x, ma.MaskedArray) for x in grids):
+                val = func(*vals)
+                out = None
+            else:
+                dtype = np.result_type(*vals)
+                # Write the result over an operand that is a scratch buffer with no other consumers
+                for child, (arg, arg_owned) in zip(children, args):
+                    if arg_owned and refs[child] == 1 and arg.dtype == dtype:
+                        out = arg
+                        break
+                else:
+                    out = self.buffer(grids[0], dtype)
+                val = func(*vals, out=out)
+            owned = not np.isscalar(val)
+            for child in children:
+                self.release(child, refs, out)
+        self.values[node_id] = (val, owned)
+        return val, owned
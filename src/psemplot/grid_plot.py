@@ -3,24 +3,105 @@ Handle the drawing of the shapefile, the legend of the plot, and writing the plo
 '''
 
 import numpy as np
+import numpy.ma as ma
+import pylab as p
+import matplotlib.colors as mpcol
+from matplotlib.collections import PolyCollection
 from .plot_data import DataPlot
+from .raster import rasterize
 
 class GridPlot(DataPlot):
     '''
     Gridded plot subclass of a dataplot
     '''
+    # Unmasked grids with fewer nonzero cells than this fraction are drawn as sparse
+    sparse_fraction = 0.05
 
     def __init__(self, in_file, opts):
         super().__init__(in_file, opts)
+        self.render = opts.render
+        self.xcell = in_file.xcell
+        self.ycell = in_file.ycell
         self.x = np.array([in_file.xcell * (col + 0.5) for col in range(in_file.cols)])
         self.y = np.array([in_file.ycell * row for row in range(in_file.rows)])
 
+    def regular(self):
+        '''
+        Check that the cell centers are evenly spaced in map coordinates so the grid can be drawn as an image
+        '''
+        return len(self.x) > 1 and len(self.y) > 1 and np.allclose(np.diff(self.x), self.xcell) and \
+          np.allclose(np.diff(self.y), self.ycell)
+
     def draw_plot(self, data, vmin, vmax):
         '''
         Draw the plot based on the data and plot type
+        With the auto renderer sparse grids are drawn as their nonzero cells and other regular grids
+          are drawn as an image
         '''
-        if self.norm:
+        if self.render == 'lut':
+            self.draw_lut(data, vmin, vmax)
+        elif self.render == 'image':
+            self.draw_image(data, vmin, vmax)
+        elif self.render == 'auto' and not isinstance(data, ma.MaskedArray) and \
+          np.count_nonzero(data) < data.size * self.sparse_fraction:
+            self.draw_sparse(data, vmin, vmax)
+        elif self.render == 'auto' and self.regular():
+            self.draw_image(data, vmin, vmax)
+        elif self.norm:
             self.data_plot = self.m.pcolormesh(self.x, self.y, data, cmap=self.cmap, norm=self.norm, shading='auto')
         else:
             self.data_plot = self.m.pcolormesh(self.x, self.y, data, cmap=self.cmap, vmin=vmin, vmax=vmax, shading='auto')
 
+    def draw_image(self, data, vmin, vmax):
+        '''
+        Draw the grid as an image covering the same area as the colormesh cells
+        The cells are centered on the x and y coordinates, so the rows are offset by half of a cell
+        '''
+        extent = (0, data.shape[1] * self.xcell, -0.5 * self.ycell, (data.shape[0] - 0.5) * self.ycell)
+        if self.norm:
+            scale = {'norm': self.norm}
+        else:
+            scale = {'vmin': vmin, 'vmax': vmax}
+        ax = p.gca()
+        self.data_plot = ax.imshow(data, extent=extent, origin='lower', interpolation='nearest', cmap=self.cmap, 
+          **scale)
+        self.m.set_axes_limits(ax=ax)
+
+    def draw_lut(self, data, vmin, vmax):
+        '''
+        Color the grid through the colormap table and draw the RGBA image onto the map
+        The image keeps the colormap and norm so the legend is drawn from the same colors
+        '''
+        norm = self.norm if self.norm else mpcol.Normalize(vmin=vmin, vmax=vmax)
+        extent = (0, data.shape[1] * self.xcell, -0.5 * self.ycell, (data.shape[0] - 0.5) * self.ycell)
+        ax = p.gca()
+        self.data_plot = ax.imshow(rasterize(data, self.cmap, norm), extent=extent, origin='lower', 
+          interpolation='nearest', cmap=self.cmap, norm=norm)
+        self.m.set_axes_limits(ax=ax)
+
+    def draw_sparse(self, data, vmin, vmax):
+        '''
+        Draw only the nonzero cells of a sparse grid over one background cell with the value of zero
+        The background covers the same area as the colormesh and is colored through the same norm
+        '''
+        rows, cols = np.nonzero(data)
+        print('NOTE: Sparse data detected. Drawing %d of %d cells' %(len(rows), data.size))
+        x0 = np.append(0, cols * self.xcell)
+        y0 = np.append(-0.5, rows - 0.5) * self.ycell
+        width = np.append(data.shape[1], np.ones(len(cols))) * self.xcell
+        height = np.append(data.shape[0], np.ones(len(rows))) * self.ycell
+        verts = np.empty((len(x0), 4, 2))
+        verts[:,0,0] = verts[:,3,0] = x0
+        verts[:,1,0] = verts[:,2,0] = x0 + width
+        verts[:,0,1] = verts[:,1,1] = y0
+        verts[:,2,1] = verts[:,3,1] = y0 + height
+        cells = PolyCollection(verts, cmap=self.cmap, edgecolors='none', antialiaseds=False)
+        cells.set_array(np.append(data.dtype.type(0), data[rows, cols]))
+        if self.norm:
+            cells.set_norm(self.norm)
+        else:
+            cells.set_clim(vmin, vmax)
+        ax = p.gca()
+        ax.add_collection(cells)
+        self.m.set_axes_limits(ax=ax)
+        self.data_plot = cells
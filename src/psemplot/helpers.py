@@ -8,8 +8,11 @@ def parse_form(form):
     Python variables. Return both the formula and the pollutants found
     '''
     import re
+    # Species group operands such as SUM(P*)_A contain symbols, so pull them out before splitting
+    group_re = r'SUM\([^()]+\)_[A-Z]'
+    pols = re.findall(group_re, form)
     # Split the formula using possible mathematical symbols
-    pols = re.split('\-|\+|\*|\/|\%|\(|\)|\[|\]|\^', form)
+    pols += re.split('\-|\+|\*|\/|\%|\(|\)|\[|\]|\^', re.sub(group_re, ' ', form))
     pol_list = []
     for pol in pols:
         pol = pol.strip()
@@ -20,20 +23,77 @@ def parse_form(form):
             # Susbstitute the species names back into the formula
             # Use a negative lookbehind for A-Z so that partial names are not
             #  replaced. ie: NO could partially replace HONO
-            form = re.sub('(?<![A-Z])%s' %pol, 'species[\"%s\"]' %pol, form)
+            form = re.sub('(?<![A-Z])%s' %re.escape(pol), 'species[\"%s\"]' %pol, form)
     if len(pol_list) < 1:
         raise ValueError('No pollutants detected in pollutant list')
     return form, pol_list
 
-def get_inputs(in_list, inputtype='netcdf'):
+def plot_name(outfile_name, num, form, total=1, time_step=None):
+    '''
+    Name the output file for one of a batch of plots
+    @N is replaced by the plot number, @F by the formula with file-unsafe characters replaced,
+      and @T by the timestep
+    A batch output name without any of these has the plot number added before the extension
+    '''
+    import re
+    import os.path
+    if total > 1 and '@N' not in outfile_name and '@F' not in outfile_name and '@T' not in outfile_name:
+        base, ext = os.path.splitext(outfile_name)
+        outfile_name = '%s_@N%s' %(base, ext)
+    safe_form = re.sub('[^A-Za-z0-9_.-]+', '_', form).strip('_')
+    safe_step = re.sub('[^A-Za-z0-9_.-]+', '_', str(time_step)).strip('_')
+    return outfile_name.replace('@N', str(num + 1)).replace('@F', safe_form).replace('@T', safe_step)
+
+def parse_tsteps(time_step, nsteps=1):
+    '''
+    Convert the timestep selection into a list of timesteps
+    Accepts a single timestep, a START:END range with END excluded, "all", or a comma separated
+      list of timesteps and ranges
+    Negative timesteps count back from the end of the file, so -1 is the last timestep
+    '''
+    def resolve(tstep):
+        tstep = int(tstep)
+        return tstep + nsteps if tstep < 0 else tstep
+    tsteps = []
+    seen = set()
+    for part in str(time_step).split(','):
+        part = part.strip()
+        if part.lower() == 'all':
+            part_steps = list(range(nsteps))
+        elif ':' in part:
+            start, end = [x.strip() for x in part.split(':', 1)]
+            part_steps = list(range(resolve(start or 0), resolve(end or nsteps)))
+        else:
+            part_steps = [resolve(part)]
+        if not part_steps or part_steps[0] < 0 or part_steps[-1] >= nsteps:
+            raise ValueError('Timestep selection %s outside of the %s timesteps in the file' %(part, nsteps))
+        tsteps += [tstep for tstep in part_steps if tstep not in seen]
+        seen.update(part_steps)
+    return tsteps
+
+def get_inputs(in_list, inputtype='netcdf', file_reduce='sum', workers=2, pol_list=None):
     '''
     Open the input netCDF(s)
+    If a pollutant list is given only the files referenced in the list are opened
+    An input given as a glob or an @list file is opened as one input reduced across its files
     Check for dimensional mismatches
     '''
     from .api.inputs import load_input
-    inf_dict = dict((chr(x + ord('A')), load_input(inputtype,in_list[x])) for x in range(len(in_list))) 
+    from .api.multi import MultiData, expand_input
+    if pol_list:
+        used = set(pol[-1] for pol in pol_list)
+    inf_dict = {}
+    for x, in_spec in enumerate(in_list):
+        if pol_list and chr(x + ord('A')) not in used:
+            continue
+        file_list = expand_input(in_spec)
+        if file_list == [in_spec]:
+            inf_dict[chr(x + ord('A'))] = load_input(inputtype, in_spec)
+        else:
+            print('NOTE: Input %s is %d files reduced using %s' %(chr(x + ord('A')), len(file_list), file_reduce))
+            inf_dict[chr(x + ord('A'))] = MultiData(inputtype, file_list, file_reduce, workers)
     if len(list(inf_dict.keys())) > 1:
-        ref = inf_dict['A']
+        ref = inf_dict[sorted(inf_dict.keys())[0]]
         for in_file in list(inf_dict.values()):
             if in_file.cols != ref.cols or in_file.rows != ref.rows or in_file.xcell != ref.xcell or \
                 in_file.xorig != ref.xorig or in_file.yorig != ref.yorig:
@@ -1 +1 @@
-__names__ = ['netcdf','latlon']
+__names__ = ['netcdf','netcdf3','latlon']
@@ -1,14 +1,45 @@
+import os
+import json
+import time
+import shutil
+import hashlib
 import numpy as np
 import pandas as pd
+from ..api.inputs import select_slab
+
+options = {'csv_engine': 'c', 'chunk_rows': 0, 'polls': None, 'cache_dir': ''}
+
+def configure(csv_engine=None, chunk_rows=None, polls=None, cache_dir=None, **kwargs):
+    '''
+    Set the module options for latlon inputs
+    chunk_rows turns on streaming reads of that many rows at a time
+    polls limits the pollutants kept from the file
+    cache_dir turns on the binary cache of parsed files
+    '''
+    if cache_dir is not None:
+        options['cache_dir'] = cache_dir
+    if csv_engine:
+        options['csv_engine'] = csv_engine
+    if chunk_rows is not None:
+        options['chunk_rows'] = int(chunk_rows)
+    if polls is not None:
+        options['polls'] = set(polls)
 
 class PsempData:
     """
     Instance of an input file.
     """
     def __init__(self, infile_name):
-        self.src = self.read_emis(infile_name)
+        self.polls = options['polls']
+        self.src = self.load_cache(infile_name)
+        if self.src is None:
+            self.src = self.read_emis(infile_name)
+            self.save_cache(infile_name)
         self.objtype = 'latlon'
         self.filename = infile_name
+        self.nsteps = 1
+        # Index of the pollutant columns
+        self.var_names = [col for col in self.src.columns if col not in ('latitude','longitude')]
         self.set_lat_lons()
 
     def __str__(self):
@@ -18,8 +49,95 @@ class PsempData:
         '''
         Set the latitude and longitude arrays
         '''
-        self.lat = self.src['latitude'].astype(float).values
-        self.lon = self.src['longitude'].astype(float).values
+        self.lat = np.asarray(self.src['latitude'].values, dtype=float)
+        self.lon = np.asarray(self.src['longitude'].values, dtype=float)
+
+    def cache_path(self, fn):
+        '''
+        Cache directory for an input file, keyed by the absolute path
+        '''
+        if not options['cache_dir']:
+            return None
+        key = hashlib.sha1(os.path.abspath(fn).encode('utf-8')).hexdigest()
+        return os.path.join(os.path.expanduser(options['cache_dir']), 'latlon', key)
+
+    def load_cache(self, fn):
+        '''
+        Load the parsed table and attributes from the cache as memory maps
+        The cache is only used if the path, size, and modification time of the file match
+        A cache built from a subset of pollutants only serves requests within that subset. Otherwise
+          the cached pollutants are read again along with the requested ones so that the cache grows.
+        '''
+        path = self.cache_path(fn)
+        if not path:
+            return None
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+        st = os.stat(fn)
+        if meta.get('path') != os.path.abspath(fn) or meta.get('size') != st.st_size or \
+          meta.get('mtime') != st.st_mtime_ns or 'table' not in meta:
+            return None
+        if not meta['complete'] and not (self.polls and self.polls <= set(meta['selected'])):
+            if self.polls:
+                self.polls = self.polls | set(meta['selected'])
+            return None
+        table = os.path.join(path, meta['table'])
+        try:
+            vals = np.load(os.path.join(table, 'values.npy'), mmap_mode='r')
+            lat = np.load(os.path.join(table, 'lat.npy'), mmap_mode='r')
+            lon = np.load(os.path.join(table, 'lon.npy'), mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+        for att, val in meta['atts'].items():
+            setattr(self, att, val)
+        df = pd.DataFrame(vals, columns=meta['polls'], copy=False)
+        df.insert(0, 'latitude', lat)
+        df.insert(1, 'longitude', lon)
+        setattr(self, 'rows', len(df))
+        print('NOTE: Using cached table for %s' %fn)
+        return df
+
+    def save_cache(self, fn):
+        '''
+        Write the parsed table and attributes to the cache
+        Each table is written to its own folder keyed by the file state and the pollutants selected,
+          so the files memory-mapped by another process are never changed. The metadata that points
+          to the table is replaced last so that a partial cache is never used, and then the tables it
+          replaced are removed.
+        '''
+        path = self.cache_path(fn)
+        if not path:
+            return
+        st = os.stat(fn)
+        polls = [col for col in self.src.columns if col not in ('latitude','longitude')]
+        selected = sorted(self.polls) if self.polls else None
+        table = hashlib.sha1(json.dumps([st.st_size, st.st_mtime_ns, selected]).encode('utf-8')).hexdigest()
+        meta = {'path': os.path.abspath(fn), 'size': st.st_size, 'mtime': st.st_mtime_ns, 'polls': polls, 
+          'selected': selected, 'complete': not self.polls, 'table': table, 'atts': self.atts}
+        arrays = (('values', np.ascontiguousarray(self.src[polls].values, dtype=float)), 
+          ('lat', self.src['latitude'].values), ('lon', self.src['longitude'].values))
+        tmp = '.%d.tmp' %os.getpid()
+        try:
+            os.makedirs(os.path.join(path, table), exist_ok=True)
+            for name, arr in arrays:
+                out_fn = os.path.join(path, table, '%s.npy' %name)
+                with open(out_fn + tmp, 'wb') as f:
+                    np.save(f, arr)
+                os.replace(out_fn + tmp, out_fn)
+            out_fn = os.path.join(path, 'meta.json')
+            with open(out_fn + tmp, 'w') as f:
+                json.dump(meta, f)
+            os.replace(out_fn + tmp, out_fn)
+        except OSError as e:
+            print('WARNING: Unable to write cache for %s: %s' %(fn, e))
+            return
+        # Open memory maps of a removed table stay valid until they are closed
+        for old in os.listdir(path):
+            if old != table and os.path.isdir(os.path.join(path, old)):
+                shutil.rmtree(os.path.join(path, old), ignore_errors=True)
 
     def read_emis(self, fn):
         '''
@@ -33,8 +151,10 @@ class PsempData:
             # Initialize atts with dummy values that aren't required for this type
             attrs = {'cols': 1, 'rows': 1, 'tstep': 1, 'sdate': 1, 'xcell': 1, 'ycell': 1, 
               'xorig': 1, 'yorig': 1}
+            nskip = 0
             for l in f:
                 if l.startswith('#'):
+                    nskip += 1
                     if l[1:5].upper() == 'ATTS':
                         proj = l[5:].strip().split(',')
                 else:
@@ -43,22 +163,92 @@ class PsempData:
             attrs[x.split(':')[0].strip().lower()] = float(x.split(':')[1].strip())
         for att, val in attrs.items():
             setattr(self, att, val)       
-        usecols = ['latitude','longitude','poll','value']
-        df = pd.read_csv(fn, usecols=usecols, dtype={'poll': str}, comment='#')
-        for col in ['latitude','longitude']:
-            df[col] = df[col].round(6).astype(str)
-        df = df.groupby(['latitude','longitude','poll'], as_index=False).sum()
-        df = pd.pivot_table(df, values='value', index=['latitude','longitude'], columns='poll',
-          aggfunc='sum', fill_value=0).reset_index()
+        self.atts = attrs
+        start = time.time()
+        read_opts = {'usecols': ['latitude','longitude','poll','value'], 'skiprows': nskip,
+          'dtype': {'latitude': float, 'longitude': float, 'poll': str, 'value': float},
+          'engine': options['csv_engine']}
+        # The pyarrow engine does not support comments, so only the header lines are skipped
+        if options['csv_engine'] != 'pyarrow':
+            read_opts['comment'] = '#'
+        if options['chunk_rows']:
+            df = self.read_chunks(fn, read_opts)
+        else:
+            df = pd.read_csv(fn, **read_opts)
+            self.nrecs = len(df)
+            df = self.select_polls(df)
+            df = self.table(self.loc_key(df['latitude'].values, df['longitude'].values), df['poll'].values,
+              df['value'].fillna(0).values)
+        elapsed = time.time() - start
+        print('NOTE: Read %d rows from %s in %.2fs (%d rows/s)' %(self.nrecs, fn, elapsed, 
+          self.nrecs / max(elapsed, 1e-6)))
         setattr(self, 'rows', len(df))
         return df
+
+    def read_chunks(self, fn, read_opts):
+        '''
+        Read the file in fixed size chunks, adding each chunk to a running sum by location and pollutant
+        Peak memory depends on the number of unique locations rather than the number of rows
+        '''
+        acc = pd.Series([], dtype=float)
+        self.nrecs = 0
+        for chunk in pd.read_csv(fn, chunksize=options['chunk_rows'], **read_opts):
+            self.nrecs += len(chunk)
+            chunk = self.select_polls(chunk)
+            part = pd.DataFrame({'loc': self.loc_key(chunk['latitude'].values, chunk['longitude'].values),
+              'poll': chunk['poll'].values, 'value': chunk['value'].fillna(0).values})
+            part = part.groupby(['loc','poll'])['value'].sum()
+            acc = part if acc.empty else acc.add(part, fill_value=0)
+        if acc.empty:
+            return self.table(np.array([], np.int64), np.array([], str), np.array([], float))
+        return self.table(acc.index.get_level_values(0).values, acc.index.get_level_values(1).values, acc.values)
+
+    def select_polls(self, df):
+        '''
+        Drop the values of pollutants that are not referenced in the formula, if they are known
+        The locations are kept so that the points match a read of all pollutants
+        Rows without a pollutant are dropped along with their locations
+        '''
+        null = df['poll'].isna()
+        if null.any():
+            df = df[~null].copy()
+        if self.polls:
+            unused = ~df['poll'].isin(self.polls)
+            df.loc[unused, 'poll'] = ''
+            df.loc[unused, 'value'] = 0
+        return df
+
+    def loc_key(self, lat, lon):
+        '''
+        Key the locations by the coordinates quantized to integer millionths of a degree
+        '''
+        return (np.rint(lat * 1e6).astype(np.int64) + 90000000) * 361000000 + \
+          (np.rint(lon * 1e6).astype(np.int64) + 180000000)
+
+    def table(self, loc_key, poll, value):
+        '''
+        Sum the values by location and pollutant into one column per pollutant
+        '''
+        loc_codes, locs = pd.factorize(loc_key, sort=True)
+        poll_codes, polls = pd.factorize(poll, sort=True)
+        sums = np.bincount(loc_codes * len(polls) + poll_codes, weights=value, 
+          minlength=len(locs) * len(polls)).reshape(len(locs), len(polls))
+        df = pd.DataFrame(sums, columns=polls)
+        if '' in df.columns:
+            df = df.drop(columns='')
+        df.insert(0, 'latitude', (locs // 361000000 - 90000000) / 1e6)
+        df.insert(1, 'longitude', (locs % 361000000 - 180000000) / 1e6)
+        return df
     
-    def var(self, var_name):
-        if var_name in list(self.src.columns):
+    def var(self, var_name, tstep=None, layer=None, rows=None):
+        '''
+        Return the variable values shaped as a single timestep and layer
+        '''
+        if var_name in self.var_names:
             arr = self.src[var_name].values
         else:
             raise ValueError('The variable %s does not exist in the file %s.' %(var_name, self.filename))
-        return np.reshape(arr, [1,1,self.rows,1])
+        return np.reshape(arr, [1,1,self.rows,1])[select_slab(tstep, layer, rows)]
 
     def close(self):
         pass
@@ -1,29 +1,199 @@
+import os.path
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import numpy.ma as ma
 import netCDF4 as ncf
+from ..api.inputs import select_slab
+
+# The netCDF-C library is not thread-safe, so every netCDF4 call, including opening, reading,
+#  and closing files of any format, is made while holding this lock
+nc_lock = threading.RLock()
+
+class DatasetPool(object):
+    """
+    Bounded LRU pool of open netCDF4 Datasets shared by all netCDF inputs
+    The least recently used idle Dataset is closed when the pool is full.
+    Datasets that are being read are never closed by eviction.
+    """
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        self.handles = OrderedDict()
+        self.in_use = {}
+        self.lock = nc_lock
+
+    @contextmanager
+    def open(self, filename):
+        '''
+        Check out an open Dataset for the file, opening it if it is not in the pool
+        The netCDF lock is held until the Dataset is checked back in
+        '''
+        with self.lock:
+            if filename in self.handles:
+                self.handles.move_to_end(filename)
+            else:
+                src = ncf.Dataset(filename)
+                # Only return masked arrays for reads that have missing values
+                if hasattr(src, 'set_always_mask'):
+                    src.set_always_mask(False)
+                self.handles[filename] = src
+            self.in_use[filename] = self.in_use.get(filename, 0) + 1
+            src = self.handles[filename]
+            self.evict()
+            try:
+                yield src
+            finally:
+                self.in_use[filename] -= 1
+                if not self.in_use[filename]:
+                    del self.in_use[filename]
+                self.evict()
+
+    def evict(self):
+        '''
+        Close idle Datasets, oldest first, until the pool is within its limit
+        '''
+        idle = [fn for fn in self.handles if not self.in_use.get(fn)]
+        while len(self.handles) > self.max_open and idle:
+            self.handles.pop(idle.pop(0)).close()
+
+    def close(self, filename):
+        '''
+        Close the Dataset for a file if it is open and idle
+        '''
+        with self.lock:
+            if filename in self.handles and not self.in_use.get(filename):
+                self.handles.pop(filename).close()
+
+pool = DatasetPool()
+
+def configure(max_open=None, **kwargs):
+    '''
+    Set the module options for netCDF inputs
+    '''
+    if max_open:
+        with pool.lock:
+            pool.max_open = max(int(max_open), 1)
+            pool.evict()
 
 class PsempData:
     """
     Instance of an input file.
+    The file is opened through the shared Dataset pool only when it is read.
     """
     def __init__(self, infile_name):
-        self.src = ncf.Dataset(infile_name)
         self.objtype = 'netcdf'
         self.filename = infile_name
-        self.get_attr()
+        # Only the header is read here
+        with pool.open(self.filename) as src:
+            self.get_attr(src)
+            self.nsteps = len(src.dimensions['TSTEP'])
+            self.hdf5 = src.data_model.startswith('NETCDF4')
+            # Index of the gridded species variables, used to resolve species groups
+            self.var_names = [name for name, arr in src.variables.items() if arr.ndim == 4]
+        # Bytes returned and bytes of chunks decompressed for each compressed variable
+        self.io_stats = {}
+        self.disk_ratio = None
 
     def __str__(self):
         return self.filename
 
-    def var(self, var_name):
-        if var_name in list(self.src.variables.keys()):
-            arr = self.src.variables[var_name]
-        else:
-            raise ValueError('The variable %s does not exist in the file %s.' %(var_name, self.filename))
-        return arr[:]
+    def var(self, var_name, tstep=None, layer=None, rows=None):
+        '''
+        Return the variable values. Only the hyperslab for the selected timestep, layer,
+          and/or rows is read from the file. A selection of None reads all of that dimension.
+        '''
+        with pool.open(self.filename) as src:
+            if var_name in src.variables:
+                arr = src.variables[var_name]
+            else:
+                raise ValueError('The variable %s does not exist in the file %s.' %(var_name, self.filename))
+            if self.hdf5:
+                self.prepare_read(src, arr, tstep, layer, rows)
+            vals = arr[select_slab(tstep, layer, rows)]
+        # A grid without masked cells is returned as a plain array so that it can be calculated in place
+        if isinstance(vals, ma.MaskedArray) and not ma.is_masked(vals):
+            vals = ma.getdata(vals)
+        return vals
+
+    def iter_tsteps(self, var_name, tsteps, layer=0, rows=None):
+        '''
+        Yield the 2D grids for a list of timesteps in chunk order
+        Consecutive timesteps that share a chunk are read together so each chunk is decompressed once
+        '''
+        step = 1
+        if self.hdf5:
+            with pool.open(self.filename) as src:
+                if var_name in src.variables:
+                    chunks = src.variables[var_name].chunking()
+                    if chunks != 'contiguous':
+                        step = chunks[0]
+        block = []
+        for tstep in sorted(tsteps):
+            if block and (tstep != block[-1] + 1 or tstep // step != block[0] // step):
+                for grid in self.var(var_name, slice(block[0], block[-1] + 1), layer, rows):
+                    yield grid
+                block = []
+            block.append(tstep)
+        if block:
+            for grid in self.var(var_name, slice(block[0], block[-1] + 1), layer, rows):
+                yield grid
+
+    def prepare_read(self, src, arr, tstep, layer, rows=None):
+        '''
+        Size the chunk cache of a chunked variable to hold the chunks touched by a read
+        Track the bytes requested and decompressed for compressed variables
+        '''
+        chunks = arr.chunking()
+        if chunks == 'contiguous':
+            return
+        touched = 1
+        requested = arr.dtype.itemsize
+        for sel, dim_len, chunk_len in zip([tstep, layer, rows], arr.shape, chunks):
+            if sel is None:
+                start, stop = (0, dim_len)
+            elif isinstance(sel, slice):
+                start, stop = sel.indices(dim_len)[:2]
+            else:
+                start, stop = (sel, sel + 1)
+            touched *= (stop - 1) // chunk_len - start // chunk_len + 1
+            requested *= stop - start
+        for dim_len, chunk_len in zip(arr.shape[3:], chunks[3:]):
+            touched *= -(-dim_len // chunk_len)
+            requested *= dim_len
+        chunk_bytes = int(np.prod(chunks)) * arr.dtype.itemsize
+        if touched * chunk_bytes > arr.get_var_chunk_cache()[0]:
+            arr.set_var_chunk_cache(size=touched * chunk_bytes, nelems=max(1009, touched * 10), preemption=0.75)
+        filters = arr.filters() or {}
+        if any(filters.get(comp) for comp in ('zlib','szip','zstd','bzip2','blosc')):
+            if self.disk_ratio is None:
+                full = sum(v.size * v.dtype.itemsize for v in src.variables.values())
+                self.disk_ratio = os.path.getsize(self.filename) / float(max(full, 1))
+            stats = self.io_stats.setdefault(arr.name, [0, 0])
+            stats[0] += requested
+            stats[1] += touched * chunk_bytes
+
+    def io_report(self, var_name=None):
+        '''
+        Print the bytes requested compared with the estimated bytes of chunks decompressed for a
+          compressed variable, or for every variable read since the last report if no name is given
+        The decompressed bytes are estimated from the chunks touched by each read and the bytes
+          read from disk from the compression ratio of the whole file
+        '''
+        for name in ([var_name,] if var_name else list(self.io_stats)):
+            if name in self.io_stats:
+                requested, decompressed = self.io_stats.pop(name)
+                print('NOTE: %s from %s: %.1f MB requested, ~%.1f MB decompressed (estimated), ~%.1f MB read from disk (estimated)' 
+                  %(name, self.filename, requested / 1048576., decompressed / 1048576., 
+                  decompressed * self.disk_ratio / 1048576.))
 
     def close(self):
-        self.src.close()
+        '''
+        Release the file. The Dataset is left in the pool for reuse until it is evicted
+        '''
+        pass
 
-    def get_attr(self):
+    def get_attr(self, src):
         '''
         set the psempdata API attributes to the I/O API attribute values
         '''
@@ -32,9 +202,8 @@ class PsempData:
                 'ycell': 'YCELL', 'sdate': 'SDATE', 'tstep': 'TSTEP', 'gdtyp': 'GDTYP', 'pgam': 'P_GAM'}
         for out_attr, in_attr in attr_dict.items():
             try:
-                val = getattr(self.src, in_attr)
+                val = getattr(src, in_attr)
             except AttributeError:
                 raise AttributeError('Attribute %s not found in %s' %(in_attr, self.filename))
             else:
                 setattr(self, out_attr, val)
-
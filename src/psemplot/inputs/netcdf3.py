@@ -0,0 +1,175 @@
+"""
+Memory-mapped reader for classic and 64-bit offset (netCDF3) I/O API files
+
+The header is parsed once and variable slices are returned as read-only numpy views of a
+ memory map of the file. Values stay big-endian as stored, so no decode pass or copy is made
+ until the data is used in a calculation.
+"""
+
+import struct
+import numpy as np
+from ..api.inputs import select_slab
+
+# netCDF3 header tags and external types
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+nc_types = {1: 'i1', 2: 'S1', 3: '>i2', 4: '>i4', 5: '>f4', 6: '>f8'}
+
+class Header(object):
+    """
+    Parser for the header of a classic netCDF file
+    """
+    def __init__(self, f):
+        self.f = f
+        magic = f.read(4)
+        if magic[:3] != b'CDF' or magic[3:] not in (b'\x01', b'\x02'):
+            raise ValueError('%s is not a classic or 64-bit offset netCDF file' %f.name)
+        self.offset_size = 8 if magic[3:] == b'\x02' else 4
+        self.numrecs = self.read_int()
+        self.dims = self.read_dims()
+        self.atts = self.read_atts()
+        self.variables = self.read_vars()
+
+    def read_int(self):
+        return struct.unpack('>i', self.f.read(4))[0]
+
+    def read_name(self):
+        nelems = self.read_int()
+        name = self.f.read(nelems).decode('utf-8')
+        self.f.read(-nelems % 4)
+        return name
+
+    def read_list(self, tag, read_item):
+        '''
+        Read a header list. An absent list is written as two zeros
+        '''
+        list_tag = self.read_int()
+        nelems = self.read_int()
+        if list_tag not in (0, tag):
+            raise ValueError('Invalid netCDF header in %s' %self.f.name)
+        return [read_item() for x in range(nelems)]
+
+    def read_dims(self):
+        return self.read_list(NC_DIMENSION, lambda: (self.read_name(), self.read_int()))
+
+    def read_att(self):
+        name = self.read_name()
+        dtype = np.dtype(nc_types[self.read_int()])
+        nelems = self.read_int()
+        raw = self.f.read(nelems * dtype.itemsize)
+        self.f.read(-(nelems * dtype.itemsize) % 4)
+        if dtype.char == 'S':
+            val = raw.decode('utf-8', 'replace')
+        else:
+            val = np.frombuffer(raw, dtype)
+            if nelems == 1:
+                val = val[0].item()
+        return (name, val)
+
+    def read_atts(self):
+        return dict(self.read_list(NC_ATTRIBUTE, self.read_att))
+
+    def read_var(self):
+        name = self.read_name()
+        dimids = [self.read_int() for x in range(self.read_int())]
+        self.read_atts()
+        dtype = np.dtype(nc_types[self.read_int()])
+        self.read_int()
+        # The vsize in the header is not reliable for large variables, so the begin offset is all that is used
+        begin = struct.unpack('>q' if self.offset_size == 8 else '>i', self.f.read(self.offset_size))[0]
+        return (name, {'dimids': dimids, 'dtype': dtype, 'begin': begin})
+
+    def read_vars(self):
+        return VarLayouts(self.read_list(NC_VARIABLE, self.read_var), self.dims)
+
+class VarLayouts(dict):
+    """
+    Variable layouts keyed by name with the record size computed from the record variables
+    """
+    def __init__(self, var_list, dims):
+        super().__init__(var_list)
+        self.recsize = 0
+        rec_vars = []
+        for name, layout in var_list:
+            layout['shape'] = tuple(dims[dimid][1] for dimid in layout['dimids'])
+            layout['record'] = bool(layout['dimids']) and dims[layout['dimids'][0]][1] == 0
+            if layout['record']:
+                rec_vars.append(layout)
+                layout['vsize'] = int(np.prod(layout['shape'][1:])) * layout['dtype'].itemsize
+        # Record variables are padded to 4 bytes unless there is only one record variable
+        if len(rec_vars) == 1:
+            self.recsize = rec_vars[0]['vsize']
+        else:
+            self.recsize = sum(layout['vsize'] + (-layout['vsize'] % 4) for layout in rec_vars)
+
+class PsempData:
+    """
+    Instance of an input file.
+    """
+    def __init__(self, infile_name):
+        self.objtype = 'netcdf'
+        self.filename = infile_name
+        self._mm = None
+        with open(infile_name, 'rb') as f:
+            self.header = Header(f)
+        self.get_attr()
+        # Index of the gridded species variables, used to resolve species groups
+        self.var_names = [name for name, layout in self.header.variables.items() if len(layout['shape']) == 4]
+        self.nsteps = self.header.numrecs
+        # A streaming file has an indeterminate number of records in the header
+        if self.nsteps < 0 and self.header.variables.recsize:
+            rec_begin = min(v['begin'] for v in self.header.variables.values() if v['record'])
+            self.nsteps = (self.mm.size - rec_begin) // self.header.variables.recsize
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def mm(self):
+        '''
+        Map the file into memory on first use
+        '''
+        if self._mm is None:
+            self._mm = np.memmap(self.filename, dtype=np.uint8, mode='r')
+        return self._mm
+
+    def var(self, var_name, tstep=None, layer=None, rows=None):
+        '''
+        Return a read-only view of the variable values for the selected timestep, layer, and/or rows
+        '''
+        try:
+            layout = self.header.variables[var_name]
+        except KeyError:
+            raise ValueError('The variable %s does not exist in the file %s.' %(var_name, self.filename))
+        dtype = layout['dtype']
+        shape = layout['shape']
+        strides = [dtype.itemsize,]
+        for dim_len in shape[:0:-1]:
+            strides.insert(0, strides[0] * dim_len)
+        if layout['record']:
+            shape = (self.nsteps,) + shape[1:]
+            strides[0] = self.header.variables.recsize
+        arr = np.ndarray(shape, dtype=dtype, buffer=self.mm, offset=layout['begin'], strides=tuple(strides))
+        return arr[select_slab(tstep, layer, rows)]
+
+    def close(self):
+        '''
+        Drop the memory map. It is released once no views of it remain
+        '''
+        self._mm = None
+
+    def get_attr(self):
+        '''
+        set the psempdata API attributes to the I/O API attribute values
+        '''
+        attr_dict = {'cols': 'NCOLS', 'rows': 'NROWS', 'palp': 'P_ALP', 'pbet': 'P_BET', 'xcent': 'XCENT',
+                'ycent': 'YCENT', 'xorig': 'XORIG', 'yorig': 'YORIG', 'xcell': 'XCELL', 
+                'ycell': 'YCELL', 'sdate': 'SDATE', 'tstep': 'TSTEP', 'gdtyp': 'GDTYP', 'pgam': 'P_GAM'}
+        for out_attr, in_attr in attr_dict.items():
+            try:
+                val = self.header.atts[in_attr]
+            except KeyError:
+                raise AttributeError('Attribute %s not found in %s' %(in_attr, self.filename))
+            else:
+                setattr(self, out_attr, val)
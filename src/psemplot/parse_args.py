@@ -9,9 +9,15 @@ def parse_args():
     data_group = OptionGroup(parser, 'Data Selection Options')
     scale_group = OptionGroup(parser, 'Scale Definition Options')
     draw_group = OptionGroup(parser, 'Plotting Options')
-    data_group.add_option('-f', '--formula', dest='formula', help='Formula to plot. Specify a species and an input file in the format [SPECIES]_[A...Z] where the A-Z corresponds to the infile order.\
-                Single file: VOC_A   Difference plot: CO_A-CO_B   % Diff: (CO_B-CO_A)/(CO_A)', default='')
-    data_group.add_option('-s', '--timestep', dest='time_step', help='Timestep to select from file. Default is 0.', default=0)
+    data_group.add_option('-f', '--formula', dest='formulas', action='append', help='Formula to plot. Specify a species and an input file in the format [SPECIES]_[A...Z] where the A-Z corresponds to the infile order.\
+                Single file: VOC_A   Difference plot: CO_A-CO_B   % Diff: (CO_B-CO_A)/(CO_A)\
+                Sum a group of species with SUM(PATTERN)_A, where PATTERN is a wildcard such as P* or a group name from --species-groups.\
+                Repeat -f to plot several formulas from one read of the inputs. Use @N (formula number) or @F (formula) in OUTFILE to name each plot.', 
+                default=[])
+    data_group.add_option('-s', '--timestep', dest='time_step', help='Timestep to select from file. Default is 0. \
+                Use START:END (END excluded), "all", or a comma separated list such as 0,6,12:15. Negative timesteps count from the end, so -1 is the last timestep. With --reduce the timesteps are aggregated, \
+                otherwise each timestep is plotted. Use @T (timestep) in OUTFILE to name each plot.', default=0)
+    data_group.add_option('--reduce', dest='reduce', help='Reduce the selected timestep range using sum, mean, max, or min', default='')
     draw_group.add_option('-t', '--title', dest='title', help='Top title.  Use @S as speciesname variable in title', default='@S')
     draw_group.add_option('-u', '--sub-title', dest='subtitle', help='Subtitle. Defaults to display max and min values', default='')
     draw_group.add_option('--scale-label', dest='scalelabel', help='Label for scale.  Defaults to tons/year.', default='tons/year')
@@ -19,6 +25,11 @@ def parse_args():
     draw_group.add_option('--ticks', dest='ticks', help='Set the number of ticks to display', default=False)
     scale_group.add_option('--vmin', dest='vmin', help='Scale minimum cutoff.  Add "%" to the end to use percentile.', default='0')
     scale_group.add_option('--vmax', dest='vmax', help='Scale maximum cutoff.  Add "%" to the end to use percentile. Defaults to 95th percentile.', default='95%')
+    scale_group.add_option('--shared-scale', dest='shared_scale', help='Use one scale for all of the plots of a run, such as several formulas or timesteps. \
+                The limits are calculated from the merged statistics of all of the plots and percentiles are estimated as with --approx-percentile.', 
+                default=False, action='store_true')
+    scale_group.add_option('--approx-percentile', dest='approx_percentile', help='Estimate percentile limits from a quantile sketch collected as the data is calculated \
+                rather than from the full dataset. Estimates are within 1% of the data value at the percentile.', default=False, action='store_true')
     scale_group.add_option('-g', dest='neutral', help='Use neutral color for values within x of 0 (or closest limit to 0).  Defaults to 0.01%.  Use single number 0-100%. 0% Disables neutral.', default='0.01%')
     scale_group.add_option('--cutoffs', dest='cutoff_list', help='Optional list of scale cutoffs to create uneven bins. Currently only works with data values zero or higher.', default='')
     scale_group.add_option('--box-legend', dest='box_legend', help='Use boxes for a legend rather than a colorbar', default=False, action='store_true')
@@ -28,23 +39,43 @@ def parse_args():
     draw_group.add_option('--shape-file', dest='shape_file', help='Path to custom shapefile', default='')
     draw_group.add_option('--shape-att', dest='shape_att', help='Shapefile attribute to plot', default='')
     draw_group.add_option('--cmap', dest='cmap', help='Matplotlib colormap', default='')
+    data_group.add_option('--file-reduce', dest='file_reduce', help='Reduce the files of a glob ("emis_*.ncf") or @list file input using sum, mean, max, or min. \
+                Defaults to sum.', default='sum')
+    data_group.add_option('--workers', dest='workers', help='Number of worker threads used to read input files and species. Reads of netcdf inputs are serialized \
+                because the netCDF library is not thread-safe, so use -i netcdf3 to read classic files concurrently. Defaults to 2.', default='2')
+    data_group.add_option('--max-open', dest='max_open', help='Maximum number of netCDF files held open at once. Defaults to 64.', default='64')
+    data_group.add_option('--csv-engine', dest='csv_engine', help='CSV parser used for latlon inputs: c, python, or pyarrow. Defaults to c.', default='c')
+    data_group.add_option('--chunk-rows', dest='chunk_rows', help='Stream latlon inputs this many rows at a time to bound memory. Defaults to 0 (read the whole file).', default='0')
+    data_group.add_option('--cache-dir', dest='cache_dir', help='Directory for cached parsed inputs and maps. Use "none" to turn off caching. Defaults to ~/.cache/psemplot.', 
+                default='~/.cache/psemplot')
+    data_group.add_option('--tile-rows', dest='tile_rows', help='Read and evaluate the formulas in blocks of this many grid rows to bound memory. Defaults to 0 (whole grid).', default='0')
+    data_group.add_option('--tile-memmap', dest='tile_memmap', help='Write the tiled formula results to temporary memory-mapped files', default=False, action='store_true')
+    data_group.add_option('--precision', dest='precision', help='Compute precision of the data: float32 or float64. Defaults to float32.', default='float32')
+    data_group.add_option('--species-groups', dest='species_groups', help='File of named species groups for SUM(NAME)_A operands. One group per line as NAME = MEMBER MEMBER ...', 
+                default='')
     data_group.add_option('--mask_less', dest='mask_less', help='Mask values lower than the specified value from the plot', default=None)
     scale_group.add_option('--force-diff', dest='force_diff', action='store_true', help='Force a difference colormap even if data has consistent signs', default=False)
+    data_group.add_option('--debug-alloc', dest='debug_alloc', help='Report the memory allocated by each stage of a plot in units of the grid size', 
+                default=False, action='store_true')
     draw_group.add_option('--hi-res', dest='hi_res', action='store_true', help='Output a high resolution plot', default=False)
     scale_group.add_option('--no-autoscale', dest='no_auto', action='store_true', help='Turn off the autoscaling and use exactly what is entered for max and min', default=False)
     scale_group.add_option('--report-max', dest='repmax', help='Report the scale maximum used to a file', default='')
     draw_group.add_option('--minmax-round', dest='mmround', help='Digits past the decimal to round for min-max', default='4')
     data_group.add_option('--bound-scale', dest='boundscale', help='Bound the scale to the specified maximum and minimum and do not include data outside of the bounds', default=False, action='store_true')
     draw_group.add_option('--draw-states', dest='drawstates', help='Draw the state boundaries with thicker lines', action='store_true', default=False)
+    draw_group.add_option('--render', dest='render', help='Gridded plot renderer: auto, image, pcolormesh, or lut. auto draws grids with few nonzero cells as those cells and other regular grids as an image. \
+                lut colors the grid from a table of the colormap colors before drawing it. Defaults to auto.', 
+                default='auto')
     draw_group.add_option('-p', dest='plottype', help='Plot type. Currently either gridded or scatter. Defaults to gridded.', default='gridded')
-    data_group.add_option('-i', dest='inputtype', help='Input file type. Currently either netcdf or latlon. Defaults to netcdf.', default='netcdf')
+    data_group.add_option('-i', dest='inputtype', help='Input file type. Currently netcdf, netcdf3 (memory-mapped classic netCDF), or latlon. Defaults to netcdf.', default='netcdf')
     parser.add_option_group(data_group)
     parser.add_option_group(scale_group)
     parser.add_option_group(draw_group)
     (opts, args) = parser.parse_args()
     if len(args) >= 2:
-        if len(opts.formula) < 3:
+        if not opts.formulas or min(len(form) for form in opts.formulas) < 3:
             parser.error('-f Must specify a formula.')
+        opts.formula = opts.formulas[0]
         try:
             int(opts.bins)
         except ValueError:
@@ -52,10 +83,40 @@ def parse_args():
     else:
         us = 'usage: %prog INFILE1 [INFILE2]... OUTFILE [opts]'
         parser.error('Use -h for opts help')
+    if opts.cache_dir.lower() == 'none':
+        opts.cache_dir = ''
+    if opts.reduce and opts.reduce not in ('sum','mean','max','min'):
+        parser.error('--reduce Must be sum, mean, max, or min')
+    if opts.precision not in ('float32','float64'):
+        parser.error('--precision Must be float32 or float64')
+    if opts.csv_engine not in ('c','python','pyarrow'):
+        parser.error('--csv-engine Must be c, python, or pyarrow')
+    try:
+        int(opts.tile_rows)
+    except ValueError:
+        parser.error('--tile-rows Number of rows must be an integer')
+    try:
+        int(opts.chunk_rows)
+    except ValueError:
+        parser.error('--chunk-rows Number of rows must be an integer')
+    if int(opts.chunk_rows) and opts.csv_engine == 'pyarrow':
+        parser.error('--chunk-rows Streaming is not supported by the pyarrow CSV engine')
+    if opts.file_reduce not in ('sum','mean','max','min'):
+        parser.error('--file-reduce Must be sum, mean, max, or min')
+    try:
+        int(opts.workers)
+    except ValueError:
+        parser.error('--workers Number of workers must be a positive integer')
+    try:
+        int(opts.max_open)
+    except ValueError:
+        parser.error('--max-open Number of open files must be a positive integer')
+    if opts.render not in ('auto','image','pcolormesh','lut'):
+        parser.error('--render Must be auto, image, pcolormesh, or lut')
     if opts.plottype not in ('gridded','scatter'):
         parser.error('-p Must be gridded or scatter')
-    if opts.inputtype not in ('netcdf','latlon'):
-        parser.error('-i Must be netcdf or latlon')
+    if opts.inputtype not in ('netcdf','netcdf3','latlon'):
+        parser.error('-i Must be netcdf, netcdf3, or latlon')
     if len(args) > 27:
         parser.error('Current input limit is 26 input files')
     elif len(args) < 2:
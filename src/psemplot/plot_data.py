@@ -9,26 +9,58 @@ import pylab as p
 import numpy as np
 import numpy.ma as ma
 from matplotlib.collections import LineCollection
-from .colors import Colors, VLimit
+from .colors import Colors, VLimit, DataStats
+from .debug import alloc_counter
+from . import shapes
 
 class DataPlot:
 
     def __init__(self, in_file, opts):
         from . import projection
-        self.proj = projection.GridProj(in_file)
+        # Each plot is drawn on its own figure
+        self.fig = p.figure()
+        self.proj = projection.GridProj(in_file, opts.cache_dir)
         self.m = self.proj.proj_map
         self.x = False
         self.y = False 
-        self.draw_shape(self.proj.name, opts.shape_file, opts.shape_att, opts.drawstates)
+        self.draw_shape(self.proj.name, opts.shape_file, opts.shape_att, opts.drawstates, opts.hi_res, opts.cache_dir)
         self.set_fontsize(opts)
         self.norm = False
+        # Artists of the current plot that are replaced when the figure is reused
+        self.data_plot = None
+        self.legend = None
+        self.subtitle = None
 
-    def draw_shape(self, proj_name, shape_file, shape_att, draw_states):
+    def reset(self):
+        '''
+        Remove the data, legend, and subtitle of the last plot so that the figure may be reused for
+          another plot with the map and boundaries already drawn
+        '''
+        p.figure(self.fig.number)
+        for artist in (self.legend, self.subtitle, self.data_plot):
+            if artist is not None:
+                artist.remove()
+        self.data_plot = None
+        self.legend = None
+        self.subtitle = None
+        self.norm = False
+
+    def draw_shape(self, proj_name, shape_file, shape_att, draw_states, hi_res=False, cache_dir=''):
         '''
         Read the shapefile onto the map and drop the lines
+        The lines are simplified to half of an output pixel and cached for the grid
         '''
         if shape_file:
-            map_shape = self.m.readshapefile(shape_file, shape_att, drawbounds=True, linewidth=0.3)           
+            # The map is never wider than the figure
+            pixel_size = (self.m.xmax - self.m.xmin) / (32 * 200. if hi_res else 16 * 100.)
+            lines = shapes.load_segments(self.m, shape_file, shape_att, self.proj.map_key, 
+              pixel_size / 2., cache_dir)
+            # Point shapefiles have no lines to draw
+            if lines is not None:
+                ax = p.gca()
+                ax.add_collection(LineCollection(lines, antialiaseds=(1,), colors='k', linewidths=0.3, 
+                  label='_nolabel_'))
+                self.m.set_axes_limits(ax=ax)
         if not shape_file or draw_states:
             self.m.drawstates()
             self.m.drawcountries()
@@ -105,7 +137,7 @@ class DataPlot:
         else:
             subtitle = 'Max: %s  Min: %s' %(round(self.raw_max, int(opts.mmround)), 
               round(self.raw_min, int(opts.mmround)))
-        p.text(.1, .1, subtitle, fontsize=self.subtitle_fontsize, verticalalignment='bottom')
+        self.subtitle = p.text(.1, .1, subtitle, fontsize=self.subtitle_fontsize, verticalalignment='bottom')
 
     def draw_legend(self, opts):
         '''
@@ -115,6 +147,7 @@ class DataPlot:
             proxy_shapes, tags = self.calc_legend_values(opts)
             leg = p.legend(proxy_shapes, tags, bbox_to_anchor=(1.02,0,0,1), loc='center left') 
             leg.set_title(opts.scalelabel, prop = {'size': self.params['legend.fontsize']})
+            self.legend = leg
         else:
             if opts.boundscale:
                 cbar = p.colorbar(self.data_plot, shrink=0.75, ticks=(self.ticks), 
@@ -129,6 +162,7 @@ class DataPlot:
                     tick_labels[-1] = '>' + tick_labels[-1]
                 cbar.ax.set_yticklabels(tick_labels, fontsize=self.params['legend.fontsize'])
             cbar.set_label(opts.scalelabel, fontsize=self.params['legend.fontsize'])
+            self.legend = cbar
 
     def set_neutral_color(self, ncolor):
         '''
@@ -141,7 +175,7 @@ class DataPlot:
             print('Defaulting to grey neutral color.') # C.Allen removed %ncolor from this
             self.ncolor = ncolor_dict['grey']
 
-    def define_diff(self, vmin_lim, vmax_lim, data, no_auto):
+    def define_diff(self, vmin_lim, vmax_lim, data, no_auto, stats=None):
         '''
         Define the min and max for difference data
         '''
@@ -150,7 +184,7 @@ class DataPlot:
         if vmax_lim.per:
             iv_max = '%s%%' %(100 - vmax_lim.nper + 1e-16)  # Put in some arbitrarily small value so that 0 isn't returned
             print('NOTE: Resetting vmin_lim to %s to balance scale' %iv_max)
-            vmin_lim = VLimit(iv_max, data)
+            vmin_lim = VLimit(iv_max, data, stats)
         # Fix scale limits of very sparse difference data 
         if (vmin_lim.x == vmax_lim.x) and vmax_lim.per:
             print('NOTE: Very sparse data, resetting scale max to percentage of data max')
@@ -161,21 +195,34 @@ class DataPlot:
             # If it is, select the max to be the absolute value of the min
             if abs(vmin_lim.x) > vmax_lim.x and vmin_lim.x < 0 and not no_auto:
                 print('NOTE: Setting vmax_lim to absolute value of vmin_lim')
-                vmax_lim = VLimit(str(abs(vmin_lim.x)), data)
+                vmax_lim = VLimit(str(abs(vmin_lim.x)), data, stats)
             else:
             # Otherwise set the min to be the negative of the max
                 print('NOTE: Setting vmin_lim to negative of vmax_lim')
-                vmin_lim = VLimit(str((vmax_lim.x * -1)), data)
+                vmin_lim = VLimit(str((vmax_lim.x * -1)), data, stats)
         return (vmin_lim.x, vmax_lim.x)
 
-    def assign_colors(self, data, opts):
+    def assign_colors(self, data, opts, stats=None):
         '''
         Populate the values -> colors -> FIPS for polygon filling
+        Statistics collected while the data was calculated may be passed to avoid rescanning the data
         '''
-        self.raw_min = data.min()
-        self.raw_max = data.max()
+        alloc_counter.start()
+        # Keep the data in the compute precision without upcasting
+        dtype = np.dtype(opts.precision)
+        if data.dtype != dtype:
+            print('NOTE: Converting %s data to %s' %(data.dtype, dtype))
+            data = data.astype(dtype)
+        if stats is None:
+            stats = DataStats(data, opts.mask_less, opts.approx_percentile)
+        elif stats.data is None and stats.sketch is None:
+            stats.data = data
+        self.raw_min = stats.raw_min
+        self.raw_max = stats.raw_max
+        # The low values are masked once when the data is drawn. The limits come from the statistics.
+        mask = None
         if opts.mask_less:
-            data = ma.masked_less(data, float(opts.mask_less))
+            mask = np.less(data, float(opts.mask_less))
         # If there is a cutoff list override any specified vmax and vmin
         if opts.cutoff_list:
             print('NOTE: Using cutoffs. Ignoring max and min specifications. Turning off autoscaling.')
@@ -183,9 +230,11 @@ class DataPlot:
             opts.vmax = str(cuts[-1])
             opts.vmin = str(cuts[0])
             opts.no_auto = True 
-        vmax_lim = VLimit(opts.vmax, data)
-        vmin_lim = VLimit(opts.vmin, data)
-        self.neutral_lim = VLimit(opts.neutral, data)
+        # Calculate every percentile that the scale may use in one pass over the data
+        stats.request(self.scale_percentiles(opts))
+        vmax_lim = VLimit(opts.vmax, data, stats)
+        vmin_lim = VLimit(opts.vmin, data, stats)
+        self.neutral_lim = VLimit(opts.neutral, data, stats)
         # Check to see if this is a "negative only" plot
         if vmax_lim.x < 0:
             print('WARNING: Vmax is negative.  May result in plotting error.')
@@ -195,20 +244,20 @@ class DataPlot:
                 if vmax_lim.per:
                     iv_max = '%s%%' %(100 - vmax_lim.nper)
                     print('NOTE: Resetting vmin to %s' %iv_max)
-                    vmin_lim = VLimit(iv_max, data)
+                    vmin_lim = VLimit(iv_max, data, stats)
                 else:
                     print('NOTE: Resetting vmin to %s' %(vmax_lim.x * -1))
-                    vmin_lim = VLimit(str(vmax_lim.x * -1), data)
+                    vmin_lim = VLimit(str(vmax_lim.x * -1), data, stats)
                 neutral_per = '%s%%' %(100 - self.neutral_lim.nper) 
-                self.neutral_lim = VLimit(neutral_per, data)
+                self.neutral_lim = VLimit(neutral_per, data, stats)
         # Setup the ticks for the legend
         colors = Colors(vmin_lim.x, vmax_lim.x, self.neutral_lim)
         # Is it difference data?
-        if (((np.amin(data) < 0 and np.amax(data) > 0) and (vmin_lim.x < 0 and vmax_lim.x >= 0)) or \
+        if (((stats.has_neg and stats.has_pos) and (vmin_lim.x < 0 and vmax_lim.x >= 0)) or \
             opts.force_diff):
             # Set up a difference color map when the absolute max and min sit on opposite sides of 0
             print('NOTE: Difference data detected')
-            vmin_lim.x, vmax_lim.x = self.define_diff(vmin_lim, vmax_lim, data, opts.no_auto)
+            vmin_lim.x, vmax_lim.x = self.define_diff(vmin_lim, vmax_lim, data, opts.no_auto, stats)
             colors.vmin, colors.vmax = (vmin_lim.x, vmax_lim.x)
             if not opts.ncolor:
                 self.ncolor = 0.82
@@ -219,25 +268,46 @@ class DataPlot:
             self.cmap, self.ticks = colors.data_cmap(self.ncolor, opts)
         if opts.repmax:
             self.report_scale_max(opts.repmax, vmax_lim.x)
-        data = self.set_data_bounds(data, vmin_lim.x, vmax_lim.x, opts)
+        alloc_counter.report('scale')
+        with alloc_counter.stage('bounds'):
+            data = self.set_data_bounds(data, vmin_lim.x, vmax_lim.x, opts, mask)
         # Normalize the colormap for a cutoff list
         if opts.cutoff_list:
             self.norm =  matplotlib.colors.BoundaryNorm(boundaries=self.ticks, ncolors=len(self.ticks)+1, extend='both')
         # Draw the colormesh
-        self.draw_plot(data, vmin_lim.x, vmax_lim.x)
+        with alloc_counter.stage('draw'):
+            self.draw_plot(data, vmin_lim.x, vmax_lim.x)
+
+    def scale_percentiles(self, opts):
+        '''
+        List the percentiles that may be needed for the scale limits, including the balanced
+          limits of difference and negative only scales
+        '''
+        pers = [float(lim.split('%')[0]) for lim in (opts.vmax, opts.vmin, opts.neutral) if '%' in lim]
+        if '%' in opts.vmax:
+            nper = float(opts.vmax.split('%')[0])
+            pers += [100 - nper, 100 - nper + 1e-16]
+        if '%' in opts.neutral:
+            pers.append(100 - float(opts.neutral.split('%')[0]))
+        return [per for per in pers if 0 < per <= 100]
 
-    def set_data_bounds(self, data, vmin, vmax, opts):
+    def set_data_bounds(self, data, vmin, vmax, opts, mask=None):
         '''
         Cap or mask the data based on command line options
+        The data is capped in place. A masked array is only made for a bounded scale or a mask of low values.
         '''
+        # Apply the limits in the precision of the data
+        vmin, vmax = (data.dtype.type(vmin), data.dtype.type(vmax))
         # Mask values above and below the max/min if bounded
         if opts.boundscale:
-            data = ma.masked_less(data, vmin)
-            data = ma.masked_greater(data, vmax)
+            outside = np.less(data, vmin)
+            outside |= np.greater(data, vmax)
+            mask = outside if mask is None else np.logical_or(mask, outside, out=mask)
         # For an unbounded scale set the data above and below the limits to the limits
         else:
-            data[data < vmin] = vmin
-            data[data > vmax] = vmax
+            np.clip(data, vmin, vmax, out=data)
+        if mask is not None:
+            data = ma.masked_array(data, mask=mask, copy=False)
         return data
 
     def report_scale_max(self, repmax, vmax):
@@ -266,7 +336,13 @@ class DataPlot:
         fig.savefig(out_file, dpi=dpi, bbox_inches='tight', format=fmt)
 
     def get_fig(self):
-        return p.gcf()
+        return self.fig
+
+    def close(self):
+        '''
+        Release the figure after it is written
+        '''
+        p.close(self.fig)
 
     def disp_plot(self):
         '''
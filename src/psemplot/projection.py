@@ -4,12 +4,19 @@ Currently supports I/O API grid types 2 (LCC) and 6 (Polar Stereographic)
 Easily extensible to other types as needed
 """
 
+import os
+import json
+import pickle
+import hashlib
 from builtins import object
 from pyproj import Proj
+from matplotlib.figure import Figure
+import mpl_toolkits.basemap
 from mpl_toolkits.basemap import Basemap
 
 class GridProj(object):
-    def __init__(self, data_obj):
+    def __init__(self, data_obj, cache_dir=''):
+        self.cache_dir = cache_dir
         if data_obj.gdtyp == 2:
             self.lcc(data_obj)
             self.name = 'lcc'
@@ -19,6 +26,44 @@ class GridProj(object):
         else:
             raise ValueError('Invalid gdtype')
 
+    def load_map(self, **map_args):
+        '''
+        Create the Basemap with the state and country boundaries already read and projected
+        The map is pickled to the cache directory keyed by the map arguments, which include the
+          projection, the grid origin, extents, and the resolution, and is reused for the same grid
+        '''
+        key = json.dumps([mpl_toolkits.basemap.__version__, map_args], sort_keys=True, default=float)
+        # Identifies the map for the other caches of the grid
+        self.map_key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        path = None
+        if self.cache_dir:
+            path = os.path.join(os.path.expanduser(self.cache_dir), 'map', '%s.pkl' %self.map_key)
+            try:
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                # A corrupt or incompatible cache is rebuilt
+                print('WARNING: Unable to read map cache %s: %s' %(path, e))
+        proj_map = Basemap(**map_args)
+        # Basemap keeps the boundaries on the map once they are drawn
+        ax = Figure().add_subplot(111)
+        proj_map.drawstates(ax=ax)
+        proj_map.drawcountries(ax=ax)
+        if path:
+            tmp = '%s.%d.tmp' %(path, os.getpid())
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp, 'wb') as f:
+                    pickle.dump(proj_map, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except (OSError, pickle.PicklingError) as e:
+                print('WARNING: Unable to write map cache: %s' %e)
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return proj_map
+
     def lcc(self, data_obj):
         self.proj_trans = Proj(proj='lcc', lat_1=data_obj.palp, lat_2=data_obj.pbet, 
           lon_0=data_obj.xcent, lat_0=data_obj.ycent, a=6370000.0, b=6370000.0)
@@ -42,7 +87,7 @@ class GridProj(object):
             xE, yE = ((data_obj.xorig + (data_obj.xcell * data_obj.cols)),
               (data_obj.yorig + (data_obj.ycell * data_obj.rows)))
         # high resolution but don't draw small lakes (area_thresh)
-        self.proj_map = Basemap(projection='lcc', lat_1=data_obj.palp, lat_2=data_obj.pbet, lon_0=data_obj.xcent, 
+        self.proj_map = self.load_map(projection='lcc', lat_1=data_obj.palp, lat_2=data_obj.pbet, lon_0=data_obj.xcent, 
             lat_0=data_obj.ycent, llcrnrx=xO, llcrnry=yO, urcrnrx=xE, urcrnry=yE, rsphere=(6370000.0, 6370000.0),
             resolution='i', area_thresh=10000.)
         '''
@@ -55,7 +100,7 @@ class GridProj(object):
         '''
 
     def polar(self, data_obj):
-        self.proj_map = Basemap(projection='stere', lat_0=data_obj.ycent, lon_0=data_obj.xcent, 
+        self.proj_map = self.load_map(projection='stere', lat_0=data_obj.ycent, lon_0=data_obj.xcent, 
             width=(data_obj.xcell * data_obj.cols), height=(data_obj.ycell * data_obj.rows), 
             lat_ts=data_obj.pbet) 
 
@@ -0,0 +1,54 @@
+"""
+Colormap lookup table rasterizer for gridded plots
+
+The data is converted to colormap table indices in one vectorized pass, the same way as the
+ plot norm and Colormap.__call__, and the RGBA image is gathered from a table of the colormap
+ colors. The image is drawn without any further normalization or colormapping by matplotlib.
+"""
+
+import numpy as np
+import numpy.ma as ma
+import matplotlib.colors as mpcol
+
+def color_table(cmap):
+    '''
+    Return the RGBA bytes of a colormap ordered as the under color, the N colormap colors,
+      the over color, and the bad color
+    '''
+    table = np.empty((cmap.N + 3, 4), dtype=np.uint8)
+    table[:-1] = cmap(np.arange(-1, cmap.N + 1), bytes=True)
+    table[-1] = cmap(ma.masked_array([0.], mask=[True]), bytes=True)[0]
+    return table
+
+def bin_index(data, norm, ncolors):
+    '''
+    Map the data to color table indices
+    Values outside of the norm go to the under and over colors. Masked and NaN values go to the bad color.
+    '''
+    if isinstance(norm, mpcol.BoundaryNorm):
+        # The bin numbers of a boundary norm index the colormap directly
+        idx = np.clip(ma.getdata(norm(data)), -1, ncolors).astype(np.intp)
+    else:
+        # Scale in the precision of the data, as the norm and colormap do
+        scaled = np.array(ma.getdata(data), dtype=np.promote_types(ma.getdata(data).dtype, np.float32))
+        if norm.vmin == norm.vmax:
+            scaled[:] = 0
+        else:
+            scaled -= norm.vmin
+            scaled /= (norm.vmax - norm.vmin)
+        scaled *= ncolors
+        scaled[~np.isfinite(scaled)] = 0
+        scaled[scaled == ncolors] = ncolors - 1
+        np.clip(scaled, -1, ncolors, out=scaled)
+        idx = np.floor(scaled, out=scaled).astype(np.intp)
+        del scaled
+    idx += 1
+    bad = ma.getmaskarray(data) | ~np.isfinite(ma.getdata(data))
+    idx[bad] = ncolors + 2
+    return idx
+
+def rasterize(data, cmap, norm):
+    '''
+    Return the RGBA image of the data colored through the colormap table
+    '''
+    return color_table(cmap)[bin_index(data, norm, cmap.N)]
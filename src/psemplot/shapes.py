@@ -0,0 +1,102 @@
+"""
+Cache of the projected line segments of a shapefile
+
+The polylines and polygon rings of a shapefile are projected onto the grid map once, simplified
+ to the size of an output pixel, and saved to the `shape` folder of the cache directory as
+ one array of float32 vertices and one array of line offsets. Later plots of the same grid
+ memory-map the arrays instead of reading and projecting the shapefile again. The cache is
+ keyed by the shapefile path, its modification time and size, the map, and the pixel size.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+def simplify(coords, offsets, tol):
+    '''
+    Drop the vertices of each line that fall in the same tol sized cell as the vertex before
+    The first and last vertex of each line are always kept
+    Returns the new coords and offsets
+    '''
+    if not len(coords) or tol <= 0:
+        return coords, offsets
+    cells = np.floor(coords / tol)
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = (cells[1:] != cells[:-1]).any(axis=1)
+    keep[offsets[:-1]] = True
+    keep[offsets[1:] - 1] = True
+    counts = np.add.reduceat(keep.astype(np.int64), offsets[:-1]) if len(offsets) > 1 else np.zeros(0, dtype=np.int64)
+    new_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    return coords[keep], new_offsets
+
+def split_lines(coords, offsets):
+    '''
+    Split the vertex array into a list of line views
+    '''
+    return [coords[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+def shape_key(shape_file, map_key, tol):
+    '''
+    Return the cache key of a shapefile projected onto a map
+    '''
+    shp = os.path.abspath(shape_file + '.shp')
+    stat = os.stat(shp)
+    key = '%s|%d|%d|%s|%r' %(shp, stat.st_mtime_ns, stat.st_size, map_key, float(tol))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def read_cache(path):
+    '''
+    Memory-map the cached vertices and offsets, returning None if they are missing or incomplete
+    '''
+    try:
+        coords = np.load(os.path.join(path, 'coords.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(path, 'offsets.npy'))
+    except (IOError, ValueError):
+        return None
+    if len(offsets) < 1 or offsets[-1] != len(coords):
+        return None
+    return coords, offsets
+
+def write_cache(path, coords, offsets):
+    '''
+    Save the vertices and offsets. The offsets are replaced last so that a partly written cache
+      is not read. Each file is written under a per-process temporary name so that concurrent
+      writers of the same cache do not interleave.
+    '''
+    tmp = '.%d.tmp' %os.getpid()
+    try:
+        os.makedirs(path, exist_ok=True)
+        for name, arr in (('coords', coords), ('offsets', offsets)):
+            fn = os.path.join(path, '%s.npy' %name)
+            with open(fn + tmp, 'wb') as f:
+                np.save(f, arr)
+            os.replace(fn + tmp, fn)
+    except OSError as e:
+        print('WARNING: Unable to write shapefile cache: %s' %e)
+
+def load_segments(proj_map, shape_file, shape_att, map_key='', tol=0., cache_dir=''):
+    '''
+    Return the projected lines of a shapefile simplified to tol map units
+    Returns None for point shapefiles, which have no lines to draw
+    '''
+    path = None
+    if cache_dir and map_key:
+        path = os.path.join(os.path.expanduser(cache_dir), 'shape', shape_key(shape_file, map_key, tol))
+        cached = read_cache(path)
+        if cached:
+            return split_lines(*cached)
+    info = proj_map.readshapefile(shape_file, shape_att, drawbounds=False)
+    if info[1] in (1, 8):
+        return None
+    lines = getattr(proj_map, shape_att)
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(line) for line in lines], out=offsets[1:])
+    coords = np.empty((offsets[-1], 2), dtype=np.float32)
+    for line, start in zip(lines, offsets[:-1].tolist()):
+        coords[start:start + len(line)] = line
+    coords, offsets = simplify(coords, offsets, tol)
+    print('NOTE: Shapefile simplified to %d of %d vertices' %(len(coords), sum(len(line) for line in lines)))
+    if path:
+        write_cache(path, coords, offsets)
+    return split_lines(coords, offsets)
@@ -0,0 +1,46 @@
+"""
+Share one scale across a group of plots
+
+The grids of the group are calculated once and spilled to temporary memory-mapped files
+ while their statistics are merged. Each plot is then drawn from its spilled grid with the
+ limits of the merged statistics, so the inputs are only read once.
+"""
+
+import numpy as np
+import numpy.ma as ma
+from .colors import DataStats
+from .tiles import alloc_grid
+
+def spill_grid(data):
+    '''
+    Copy a grid to a temporary memory-mapped file unless it is already memory-mapped
+    The mask of a masked grid is spilled along with it and a masked array of the spilled grid is returned
+    '''
+    if ma.is_masked(data):
+        return ma.masked_array(spill_grid(ma.getdata(data)), spill_grid(ma.getmaskarray(data)), copy=False)
+    data = ma.getdata(data)
+    if isinstance(data, np.memmap):
+        return data
+    grid = alloc_grid(data.shape, data.dtype, True)
+    grid[:] = data
+    return grid
+
+def share_scale(results, mask_less=None):
+    '''
+    Collect a group of (key, grid, stats) plot results and merge their statistics
+    The percentiles of the group are estimated from the merged quantile sketches
+    Returns the spilled results and the merged DataStats to use for the scale of every plot
+    '''
+    scale_stats = DataStats(mask_less=mask_less, approx=True)
+    group = []
+    for key, data, stats in results:
+        grid = spill_grid(data)
+        del data
+        if stats is None or stats.sketch is None:
+            stats = DataStats(grid, mask_less, True)
+        scale_stats.merge(stats)
+        group.append((key, grid, stats))
+    if not group:
+        raise ValueError('No plots in the shared scale group')
+    print('NOTE: Shared scale of %d plots. Max: %s  Min: %s' %(len(group), scale_stats.raw_max, scale_stats.raw_min))
+    return group, scale_stats
@@ -0,0 +1,89 @@
+"""
+Mergeable quantile sketch for estimating percentiles without holding the data
+
+Values are counted in logarithmically sized buckets, the same as a DDSketch. Bucket i holds
+ the magnitudes in (gamma^(i-1), gamma^i] where gamma = (1 + rel_err) / (1 - rel_err). A
+ quantile is returned as the center of the bucket that holds its rank, so the estimate is
+ within rel_err * |value| of the data value at the rank q * (count - 1), rounded down.
+Zeros are counted exactly and non-finite values are not counted. Sketches with the same
+ error bound may be merged in any order.
+"""
+
+import math
+import numpy as np
+
+class QuantileSketch(object):
+    """
+    Log bucket histogram of the positive and negative values fed to it
+    """
+    def __init__(self, rel_err=0.01):
+        if not 0 < rel_err < 1:
+            raise ValueError('Sketch relative error must be between 0 and 1')
+        self.rel_err = rel_err
+        self.gamma = (1 + rel_err) / (1 - rel_err)
+        self.log_gamma = math.log(self.gamma)
+        self.pos = {}
+        self.neg = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        '''
+        Count a block of values
+        '''
+        values = np.asarray(values).ravel()
+        values = values[np.isfinite(values)]
+        self.count += values.size
+        self.zeros += values.size - np.count_nonzero(values)
+        self.fold(self.pos, values[values > 0])
+        self.fold(self.neg, -values[values < 0])
+
+    def fold(self, store, values):
+        '''
+        Add the bucket counts of a set of magnitudes to a store
+        '''
+        if values.size:
+            keys = np.ceil(np.log(values.astype(np.float64)) / self.log_gamma).astype(np.int64)
+            keys, counts = np.unique(keys, return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + count
+
+    def merge(self, other):
+        '''
+        Fold the counts of another sketch into this one
+        '''
+        if other.gamma != self.gamma:
+            raise ValueError('Sketches with different error bounds cannot be merged')
+        for store, other_store in ((self.pos, other.pos), (self.neg, other.neg)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def value(self, key):
+        '''
+        Return the magnitude at the center of a bucket
+        '''
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        '''
+        Estimate the value at a quantile from 0 to 1
+        '''
+        if not self.count:
+            raise ValueError('No values in the quantile sketch')
+        if not 0 <= q <= 1:
+            raise ValueError('Quantile must be in the range 0-1')
+        rank = int(q * (self.count - 1))
+        for key in sorted(self.neg, reverse=True):
+            rank -= self.neg[key]
+            if rank < 0:
+                return -self.value(key)
+        rank -= self.zeros
+        if rank < 0:
+            return 0.
+        for key in sorted(self.pos):
+            rank -= self.pos[key]
+            if rank < 0:
+                return self.value(key)
+        return self.value(max(self.pos))
@@ -0,0 +1,201 @@
+"""
+Read the species grids referenced by a formula from the input files
+Reductions across timesteps are streamed one 2D slice at a time
+"""
+
+import re
+import time
+from fnmatch import fnmatch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .helpers import parse_tsteps
+
+def as_precision(grid, dtype=None):
+    '''
+    Cast a grid to the compute precision
+    Grids that differ only in byte order, such as memory-mapped big-endian values, are not copied
+    '''
+    if dtype is None or grid.dtype.newbyteorder('=') == dtype:
+        return grid
+    return grid.astype(dtype)
+
+# Named species groups loaded from a --species-groups file
+species_groups = OrderedDict()
+
+def load_species_groups(fn):
+    '''
+    Load named species groups from a file with one group per line in the format:
+      NAME = MEMBER MEMBER ...
+    Members are separated by spaces or commas and may be wildcard patterns. Lines starting with # are ignored
+    '''
+    with open(fn) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            if '=' not in line:
+                raise ValueError('Invalid species group line in %s: %s' %(fn, line))
+            name, members = line.split('=', 1)
+            members = members.replace(',', ' ').split()
+            if not name.strip() or not members:
+                raise ValueError('Invalid species group line in %s: %s' %(fn, line))
+            species_groups[name.strip()] = members
+
+def is_group(var_name):
+    '''
+    Check if a species operand is a group such as SUM(P*) or SUM(PM25)
+    '''
+    return re.match(r'SUM\(.+\)$', var_name) is not None
+
+def resolve_group(in_file, var_name):
+    '''
+    Return the variables of a file that are members of a species group
+    A named group is looked up in the loaded species groups, otherwise the operand is a wildcard pattern.
+    The members are matched against the variable index of the file
+    '''
+    try:
+        index = in_file.var_names
+    except AttributeError:
+        raise ValueError('Species groups are not supported by the input %s' %in_file)
+    spec = var_name[4:-1].strip()
+    names = []
+    for pattern in species_groups.get(spec, [spec,]):
+        matches = [name for name in index if fnmatch(name, pattern)]
+        if not matches and spec in species_groups:
+            print('NOTE: Species %s of group %s not found in %s' %(pattern, spec, in_file))
+        names += [name for name in matches if name not in names]
+    if not names:
+        raise ValueError('No variables in %s match the species group %s' %(in_file, var_name))
+    return names
+
+def iter_group(in_file, var_names, tsteps, layer=0, rows=None, dtype=None):
+    '''
+    Yield the sum of the members of a species group for each timestep
+    The members are added into a single reused grid in the compute precision
+    '''
+    acc = None
+    for tstep in tsteps:
+        for num, var_name in enumerate(var_names):
+            grid = in_file.var(var_name, tstep, layer, rows)
+            if acc is None:
+                acc = np.array(grid, dtype=dtype or grid.dtype.newbyteorder('='))
+            elif num == 0:
+                acc[...] = grid
+            else:
+                np.add(acc, grid, out=acc)
+        yield acc
+
+class Reducer(object):
+    """
+    Running accumulator for a reduction over a series of 2D grids
+    The accumulator is kept in the compute precision if one is given
+    """
+    methods = ('sum','mean','max','min')
+
+    def __init__(self, method='sum', dtype=None):
+        if method not in self.methods:
+            raise ValueError('Invalid reduction method %s. Must be one of: %s' %(method, ', '.join(self.methods)))
+        self.method = method
+        self.dtype = dtype
+        self.acc = None
+        self.count = 0
+        self.nbytes = 0
+
+    def add(self, grid):
+        '''
+        Fold a grid into the accumulator
+        '''
+        self.count += 1
+        self.nbytes += grid.nbytes
+        if self.acc is None:
+            self.acc = grid.astype(self.dtype or grid.dtype.newbyteorder('='))
+        elif self.method in ('sum','mean'):
+            np.add(self.acc, grid, out=self.acc)
+        elif self.method == 'max':
+            np.maximum(self.acc, grid, out=self.acc)
+        else:
+            np.minimum(self.acc, grid, out=self.acc)
+
+    def result(self):
+        '''
+        Return the reduced grid
+        '''
+        if self.acc is None:
+            raise ValueError('Nothing to reduce')
+        if self.method == 'mean':
+            self.acc /= self.count
+        return self.acc
+
+    def report(self, label, elapsed):
+        '''
+        Print the read and reduce throughput
+        '''
+        mb = self.nbytes / 1048576.
+        rate = mb / elapsed if elapsed > 0 else float('inf')
+        print('NOTE: %s %s over %d grids: %.1f MB in %.2fs (%.1f MB/s)' %(self.method.capitalize(), label, 
+          self.count, mb, elapsed, rate))
+
+def read_grid(in_file, var_name, tsteps, layer=0, method='sum', report=True, rows=None, dtype=None):
+    '''
+    Read the 2D grid for a species over a list of timesteps
+    Multiple timesteps are reduced using the method one timestep at a time, in chunk order
+      for inputs that define iter_tsteps
+    Species group operands are resolved against the variable index of the file and summed as they are read
+    Inputs that define their own read_grid, such as a multiple file input, handle the reduction
+    '''
+    if hasattr(in_file, 'read_grid'):
+        return in_file.read_grid(var_name, tsteps, layer, method, rows, report, dtype)
+    var_names = resolve_group(in_file, var_name) if is_group(var_name) else [var_name,]
+    if is_group(var_name):
+        grids = iter_group(in_file, var_names, tsteps, layer, rows, dtype)
+    elif len(tsteps) == 1:
+        grids = None
+    elif hasattr(in_file, 'iter_tsteps'):
+        grids = in_file.iter_tsteps(var_name, tsteps, layer, rows)
+    else:
+        grids = (in_file.var(var_name, tstep, layer, rows) for tstep in tsteps)
+    if grids is None:
+        grid = as_precision(in_file.var(var_name, tsteps[0], layer, rows), dtype)
+    elif len(tsteps) == 1:
+        grid = next(grids)
+    else:
+        red = Reducer(method, dtype)
+        start = time.time()
+        for tgrid in grids:
+            red.add(tgrid)
+        if report:
+            red.report('%s from %s' %(var_name, in_file), time.time() - start)
+        grid = red.result()
+    if report and hasattr(in_file, 'io_report'):
+        for name in var_names:
+            in_file.io_report(name)
+    return grid
+
+def read_species(inf_dict, pol_list, time_step=0, layer=0, method='sum', workers=2, rows=None, report=True,
+  dtype=None):
+    '''
+    Read the grids for all of the pollutants in a formula using a pool of worker threads
+    The reads for each input file are grouped into one task and each pollutant is read once
+    Returns once all of the pollutants have been read
+    rows optionally limits the reads to a block of grid rows
+    dtype is the compute precision of the returned grids
+    '''
+    groups = OrderedDict()
+    for pol in pol_list:
+        if pol[-1] not in inf_dict:
+            raise ValueError('File "%s" referenced in formula, but no such file entry exists.' %pol[-1])
+        if pol not in groups.setdefault(pol[-1], []):
+            groups[pol[-1]].append(pol)
+    def read_file(file_key):
+        in_file = inf_dict[file_key]
+        tsteps = parse_tsteps(time_step, getattr(in_file, 'nsteps', 1))
+        return [(pol, read_grid(in_file, pol[:-2], tsteps, layer, method, report, rows, dtype)) for pol in groups[file_key]]
+    species = {}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(int(workers), 1)) as pool:
+        for grids in pool.map(read_file, list(groups.keys())):
+            species.update(grids)
+    if report:
+        print('NOTE: Read %d species from %d files in %.2fs' %(len(species), len(groups), time.time() - start))
+    return species
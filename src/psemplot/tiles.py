@@ -0,0 +1,68 @@
+"""
+Evaluate the formulas over blocks of grid rows
+
+Only the rows of a block are read from the inputs and evaluated at a time. The block
+ results are written into one preallocated output grid per formula and the scale
+ statistics of each block are collected by the worker threads while the next block is read.
+"""
+
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import numpy.ma as ma
+from .colors import DataStats
+from .species import read_species
+
+def alloc_grid(shape, dtype, use_memmap=False):
+    '''
+    Allocate an output grid, optionally backed by an anonymous temporary file
+    '''
+    if use_memmap:
+        return np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+', shape=shape)
+    return np.empty(shape, dtype=dtype)
+
+def evaluate_tiled(batch, inf_dict, nrows, tile_rows, time_step=0, layer=0, method='sum', workers=2,
+  mask_less=None, use_memmap=False, dtype=None, approx=False):
+    '''
+    Evaluate a formula batch block by block
+    Generates the output grid and DataStats of each formula, dropping each after it is used
+    With approx the percentiles of each formula are estimated from merged quantile sketches of the blocks
+    Masked cells of the blocks are kept in a mask grid, which is only allocated once a block has masked cells
+    '''
+    outputs = [None] * len(batch.formulas)
+    masks = [None] * len(batch.formulas)
+    stats = [DataStats(mask_less=mask_less, approx=approx) for formula in batch.formulas]
+    block_stats = [[] for formula in batch.formulas]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(int(workers), 1)) as pool:
+        for row in range(0, nrows, tile_rows):
+            rows = slice(row, min(row + tile_rows, nrows))
+            species = read_species(inf_dict, batch.pol_list, time_step, layer, method, workers, rows, False, dtype)
+            for num, block in enumerate(batch.evaluate(species)):
+                if outputs[num] is None:
+                    outputs[num] = alloc_grid((nrows,) + block.shape[1:], block.dtype, use_memmap)
+                outputs[num][rows] = ma.getdata(block)
+                if masks[num] is None and ma.is_masked(block):
+                    masks[num] = alloc_grid(outputs[num].shape, bool, use_memmap)
+                    masks[num][:] = False
+                if masks[num] is not None:
+                    masks[num][rows] = ma.getmaskarray(block)
+                    block = ma.masked_array(outputs[num][rows], masks[num][rows], copy=False)
+                else:
+                    block = outputs[num][rows]
+                block_stats[num].append(pool.submit(DataStats, block, mask_less, approx))
+    for num, futures in enumerate(block_stats):
+        for future in futures:
+            stats[num].merge(future.result())
+    print('NOTE: Evaluated %d formulas over %d blocks of %d rows in %.2fs' %(len(outputs), 
+      -(-nrows // tile_rows), tile_rows, time.time() - start))
+    # The chunk reads of all of the blocks are reported together
+    for in_file in inf_dict.values():
+        if hasattr(in_file, 'io_report'):
+            in_file.io_report()
+    while outputs:
+        out, mask = (outputs.pop(0), masks.pop(0))
+        if mask is not None:
+            out = ma.masked_array(out, mask, copy=False)
+        yield out, stats.pop(0)
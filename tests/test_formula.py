@@ -0,0 +1,70 @@
+import numpy as np
+import numpy.ma as ma
+import netCDF4 as ncf
+from psemplot.api.inputs import load_input
+from psemplot.species import read_species
+from psemplot.formula import Formula, FormulaBatch
+from psemplot.tiles import evaluate_tiled
+
+def write_grid(fn, species, fill=None):
+    '''
+    Write a one timestep I/O API style file with random species grids
+    '''
+    rng = np.random.default_rng(0)
+    ds = ncf.Dataset(fn, 'w')
+    for dim, size in (('TSTEP', None), ('LAY', 1), ('ROW', 4), ('COL', 5)):
+        ds.createDimension(dim, size)
+    for att, val in dict(NCOLS=5, NROWS=4, P_ALP=33., P_BET=45., XCENT=-97., YCENT=40., XORIG=0., YORIG=0.,
+      XCELL=12000., YCELL=12000., SDATE=2016001, TSTEP=10000, GDTYP=2, P_GAM=-97.).items():
+        setattr(ds, att, val)
+    grids = {}
+    for name in species:
+        var = ds.createVariable(name, 'f4', ('TSTEP','LAY','ROW','COL'), fill_value=fill)
+        grids[name] = rng.random((1, 1, 4, 5)).astype('f4')
+        if fill is not None:
+            grids[name][0, 0, 0, 0] = fill
+        var[:] = grids[name]
+    ds.close()
+    return grids
+
+def evaluate(fn, form):
+    in_file = load_input('netcdf', fn)
+    batch = FormulaBatch([Formula(form)])
+    species = read_species({'A': in_file}, batch.pol_list, 0, 0, 'sum', 1, report=False)
+    calls = []
+    buffer = batch.buffer
+    def counted(like, dtype):
+        calls.append(dtype)
+        return buffer(like, dtype)
+    batch.buffer = counted
+    return next(batch.evaluate(species)), calls
+
+def test_netcdf_in_place(tmp_path):
+    fn = str(tmp_path / 'grid.ncf')
+    grids = write_grid(fn, ('S1','S2','S3','S4'))
+    result, calls = evaluate(fn, 'S1_A+S2_A*S3_A-S4_A')
+    assert not isinstance(result, ma.MaskedArray)
+    # Only the first operation allocates a grid, the rest are written in place
+    assert len(calls) == 1
+    expected = grids['S1'] + grids['S2'] * grids['S3'] - grids['S4']
+    assert np.allclose(result, expected[0, 0])
+
+def test_netcdf_masked(tmp_path):
+    fn = str(tmp_path / 'masked.ncf')
+    write_grid(fn, ('S1','S2'), fill=-9.)
+    for form in ('S1_A+S2_A', 'S1_A'):
+        result, calls = evaluate(fn, form)
+        assert isinstance(result, ma.MaskedArray)
+        assert result.mask[0, 0] and result.mask.sum() == 1
+
+def test_netcdf_masked_tiled(tmp_path):
+    fn = str(tmp_path / 'masked.ncf')
+    grids = write_grid(fn, ('S1','S2'), fill=-9.)
+    in_file = load_input('netcdf', fn)
+    batch = FormulaBatch([Formula('S1_A+S2_A')])
+    for use_memmap in (False, True):
+        result, stats = next(evaluate_tiled(batch, {'A': in_file}, 4, 3, use_memmap=use_memmap))
+        assert isinstance(result, ma.MaskedArray)
+        assert result.mask[0, 0] and result.mask.sum() == 1
+        expected = (grids['S1'] + grids['S2'])[0, 0]
+        assert np.isclose(stats.raw_min, expected[result.mask == False].min())
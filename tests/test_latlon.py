@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from psemplot.api.inputs import configure_input, load_input
+
+CSV = '''#ATTS gdtyp:2,palp:33,pbet:45,pgam:-97,xcent:-97,ycent:40
+latitude,longitude,poll,value
+30,-90,SO2,1
+30,-90,SO2,2
+31,-91,,100
+32,-92,NOX,5
+'''
+
+@pytest.mark.parametrize('chunk_rows', [0, 2])
+@pytest.mark.parametrize('polls', [[], ['SO2']])
+def test_blank_poll_rows_dropped(tmp_path, chunk_rows, polls):
+    fn = tmp_path / 'blank.csv'
+    fn.write_text(CSV)
+    configure_input('latlon', chunk_rows=chunk_rows, polls=polls, cache_dir='')
+    in_file = load_input('latlon', str(fn))
+    assert in_file.rows == 2
+    assert np.allclose(in_file.lat, [30, 32])
+    assert np.allclose(in_file.var('SO2').ravel(), [3, 0])
+
+def test_cache_keeps_poll_filter(tmp_path):
+    fn = tmp_path / 'blank.csv'
+    fn.write_text(CSV)
+    cache_dir = str(tmp_path / 'cache')
+    configure_input('latlon', chunk_rows=2, polls=['SO2'], cache_dir=cache_dir)
+    assert load_input('latlon', str(fn)).var_names == ['SO2']
+    # A pollutant outside of the cached subset is read along with the cached pollutants
+    configure_input('latlon', polls=['NOX'])
+    assert load_input('latlon', str(fn)).var_names == ['NOX', 'SO2']
+    configure_input('latlon', polls=['SO2'])
+    in_file = load_input('latlon', str(fn))
+    assert in_file.var_names == ['NOX', 'SO2']
+    assert np.allclose(in_file.var('SO2').ravel(), [3, 0])
+    configure_input('latlon', cache_dir='')